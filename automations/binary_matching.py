@@ -0,0 +1,191 @@
+import numpy as np
+
+from typing import Optional
+
+from automations import gui
+from automations.tiled_matching import load_cv2_image
+from shapes.common import Box
+
+# Pixels darker than this are ink, the rest is paper
+INK_THRESHOLD = 128
+
+
+class BinaryMatcher(gui.PyScreezeOverride):
+    """Stand-in for pyscreeze that can match black strokes on white paper as 1-bit masks.
+
+    Called with binary=True, the frame and the template are thresholded into ink masks and packed eight
+    pixels to a byte with numpy.packbits, so the frame is read as 24 times less data than in RGB.
+    The matching is done in three steps:
+
+    1. Probe: a few template pixels that stay the same when the match is off by a pixel are compared to the
+       frame at every position at once, eight positions per byte. Positions where more than probe_tolerance
+       of the probes disagree are dropped. On blank paper every ink probe disagrees.
+    2. Score: the positions left are compared to the template row by row. XOR of the packed rows gives the
+       differing pixels and AND the shared ink, and their popcounts give the correlation of the two masks.
+    3. Confirm: the max_candidates best positions that score at most score_margin under the confidence are
+       correlated with the template the same way pyscreeze does, and the ones above the confidence are the matches.
+
+    The probes and the mask correlation treat every pixel as pure ink or paper. Anti-aliased strokes can
+    correlate above the confidence while failing those steps, so matches pyscreeze finds can be missed.
+    Machine uses it only where a calibrated match profile found the counts exact, see apply_match_profile.
+
+    Without binary=True the call goes to pyscreeze untouched.
+
+    Args:
+        probe_count (int): Template pixels tested at every position, half of them ink and half paper.
+        probe_tolerance (int): Probes that may disagree at a position that is still scored.
+        score_margin (float): How much lower the mask correlation can be than the confidence. Covers the anti-aliased edges.
+        max_candidates (int): Most positions confirmed with correlation.
+    """
+    own_attributes = ("probe_count", "probe_tolerance", "score_margin", "max_candidates")
+
+    def __init__(self, probe_count: int = 32, probe_tolerance: int = 2, score_margin: float = 0.05, max_candidates: int = 1000):
+        self.probe_count = probe_count
+        self.probe_tolerance = probe_tolerance
+        self.score_margin = score_margin
+        self.max_candidates = max_candidates
+
+    def locateAll(self, needleImage, haystackImage, grayscale: Optional[bool] = None, limit: int = 10000, region=None, step: int = 1, confidence: float = 0.999, binary: bool = False, **kwargs):
+        """
+        Same arguments and results as pyscreeze.locateAll. With binary=True the masks are matched first.
+        Other keyword arguments are for the matchers under this one
+        """
+        inner = self._inner
+        if grayscale is None:
+            grayscale = inner.GRAYSCALE_DEFAULT
+        if not binary or region is not None or step != 1:
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, region=region, step=step, confidence=confidence, **kwargs)
+
+        import cv2
+        needle = load_cv2_image(needleImage, grayscale)
+        haystack = load_cv2_image(haystackImage, grayscale)
+        needle_gray = needle if grayscale else cv2.cvtColor(needle, cv2.COLOR_BGR2GRAY)
+        haystack_gray = haystack if grayscale else cv2.cvtColor(haystack, cv2.COLOR_BGR2GRAY)
+        needle_mask = needle_gray < INK_THRESHOLD
+        # Blank and solid templates have no strokes to match
+        too_large = needle_mask.shape[0] > haystack_gray.shape[0] or needle_mask.shape[1] > haystack_gray.shape[1]
+        if too_large or not needle_mask.any() or needle_mask.all():
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, confidence=confidence, **kwargs)
+
+        packed_frame = pack_shifted_mask(haystack_gray < INK_THRESHOLD)
+        probes = get_probe_pixels(needle_mask, self.probe_count)
+        ys, xs = find_probed_positions(packed_frame, probes, needle_mask.shape, haystack_gray.shape, self.probe_tolerance)
+        scores = score_positions(packed_frame, needle_mask, ys, xs)
+
+        best = np.argsort(-scores, kind="stable")[:self.max_candidates]
+        best = best[scores[best] >= confidence - self.score_margin]
+        matches = sorted(
+            (int(ys[index]), int(xs[index])) for index in best
+            if _correlate(haystack, needle, int(ys[index]), int(xs[index])) > confidence
+        )[:limit]
+
+        if not matches and getattr(inner, "USE_IMAGE_NOT_FOUND_EXCEPTION", True):
+            raise inner.ImageNotFoundException("Could not locate the image")
+        needle_height, needle_width = needle_mask.shape
+        return [Box(x, y, needle_width, needle_height) for y, x in matches]
+
+
+def get_probe_pixels(mask: np.ndarray, count: int) -> list[tuple[int, int, bool]]:
+    """
+    Spreads up to count probes over the mask, half on ink and half on paper, as (row, column, is ink).
+    Pixels with the same value all around are preferred, they agree with the frame even when the match is off by a pixel.
+
+    Examples:
+        >>> mask = np.zeros((6, 6), dtype=bool)
+        >>> mask[:, :3] = True
+        >>> get_probe_pixels(mask, 4)
+        [(0, 0, True), (5, 1, True), (0, 4, False), (5, 5, False)]
+    """
+    height, width = mask.shape
+    padded = np.pad(mask, 1, mode="edge")
+    stable = np.logical_and.reduce([
+        padded[row:row + height, column:column + width] == mask for row in range(3) for column in range(3)
+    ])
+    probes = []
+    for ink in (True, False):
+        rows, columns = np.nonzero(stable & (mask == ink))
+        if not len(rows):
+            rows, columns = np.nonzero(mask == ink)
+        picked = np.linspace(0, len(rows) - 1, min(count // 2, len(rows))).astype(int)
+        probes.extend((int(rows[index]), int(columns[index]), ink) for index in picked)
+    return probes
+
+
+def pack_shifted_mask(mask: np.ndarray) -> list[np.ndarray]:
+    """
+    Packs the rows of the mask eight pixels to a byte, once for each of the eight bit offsets.
+    Byte k of the shift s holds the columns s + 8k to s + 8k + 7, so any eight consecutive columns are one byte.
+
+    Examples:
+        >>> mask = np.array([[1, 0, 0, 0, 0, 0, 0, 0, 1]], dtype=bool)
+        >>> [shifted[0].tolist() for shifted in pack_shifted_mask(mask)[:2]]
+        [[128, 128], [1]]
+    """
+    return [np.packbits(mask[:, shift:], axis=1) for shift in range(8)]
+
+
+def find_probed_positions(
+        packed_frame: list[np.ndarray],
+        probes: list[tuple[int, int, bool]],
+        needle_shape: tuple[int, int],
+        haystack_shape: tuple[int, int],
+        tolerance: int
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of the positions where at most tolerance probes disagree with the frame"""
+    result_rows = haystack_shape[0] - needle_shape[0] + 1
+    result_columns = haystack_shape[1] - needle_shape[1] + 1
+    result_bytes = (result_columns + 7) // 8
+
+    # Saturating bit counters: bit of counters[i] is set where more than i probes have disagreed
+    counters = [np.zeros((result_rows, result_bytes), dtype=np.uint8) for _ in range(tolerance + 1)]
+    for row, column, ink in probes:
+        shifted = packed_frame[column % 8]
+        first_byte = column // 8
+        frame_bits = shifted[row:row + result_rows, first_byte:first_byte + result_bytes]
+        disagree = ~frame_bits if ink else frame_bits
+        for level in range(tolerance, 0, -1):
+            counters[level] |= counters[level - 1] & disagree
+        counters[0] |= disagree
+
+    # Only the bytes with a passed position are unpacked, on paper that is a small part of the frame
+    passed = ~counters[tolerance]
+    byte_rows, byte_columns = np.nonzero(passed)
+    bits = np.unpackbits(passed[byte_rows, byte_columns][:, None], axis=1)
+    indices, bit_columns = np.nonzero(bits)
+    ys, xs = byte_rows[indices], byte_columns[indices] * 8 + bit_columns
+    inside = xs < result_columns
+    return ys[inside], xs[inside]
+
+
+def score_positions(packed_frame: list[np.ndarray], needle_mask: np.ndarray, ys: np.ndarray, xs: np.ndarray, chunk: int = 256) -> np.ndarray:
+    """
+    Correlation of the template mask and the frame mask at each position, counted from the packed rows.
+    Same as pyscreeze would give for pure black and white images.
+    """
+    needle_height, needle_width = needle_mask.shape
+    packed_needle = np.packbits(needle_mask, axis=1)
+    # The last byte of a row has bits past the template width
+    valid_bits = np.packbits(np.ones(needle_width, dtype=bool))
+    rows = np.arange(needle_height)[None, :, None]
+    byte_columns = np.arange(packed_needle.shape[1])[None, None, :]
+
+    area = needle_height * needle_width
+    needle_ink = int(needle_mask.sum())
+    scores = np.zeros(len(ys))
+    for shift in range(8):
+        indices = np.nonzero(xs % 8 == shift)[0]
+        for start in range(0, len(indices), chunk):
+            part = indices[start:start + chunk]
+            windows = packed_frame[shift][ys[part][:, None, None] + rows, (xs[part] // 8)[:, None, None] + byte_columns] & valid_bits
+            differing = np.bitwise_count(windows ^ packed_needle).sum(axis=(1, 2), dtype=np.int64)
+            shared = np.bitwise_count(windows & packed_needle).sum(axis=(1, 2), dtype=np.int64)
+            frame_ink = differing - needle_ink + 2 * shared
+            spread = np.sqrt(needle_ink * (area - needle_ink) * frame_ink * (area - frame_ink), dtype=np.float64)
+            scores[part] = np.divide(area * shared - needle_ink * frame_ink, spread, out=np.zeros(len(part)), where=spread > 0)
+    return scores
+
+
+def _correlate(haystack: np.ndarray, needle: np.ndarray, top: int, left: int) -> float:
+    import cv2
+    window = haystack[top:top + needle.shape[0], left:left + needle.shape[1]]
+    return float(cv2.matchTemplate(window, needle, cv2.TM_CCOEFF_NORMED)[0, 0])
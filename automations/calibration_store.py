@@ -0,0 +1,59 @@
+import json
+import os
+import platform
+from typing import Any, Optional
+
+# Can be moved with the PYTHON_PAINTER_CALIBRATION environment variable
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".cache", "python_painter", "calibration.json")
+
+
+class CalibrationStore:
+    """JSON file of calibration results that should survive between runs.
+
+    Results are grouped in sections, e.g. "action_costs", and keyed inside them,
+    usually by get_machine_key() so several machines can share the file.
+
+    Examples:
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "calibration.json")
+        >>> store = CalibrationStore(path)
+        >>> store.set("section", "key", {"value": 1})
+        >>> CalibrationStore(path).get("section", "key")
+        {'value': 1}
+        >>> CalibrationStore(path).get("section", "missing", "default")
+        'default'
+    """
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.environ.get("PYTHON_PAINTER_CALIBRATION", DEFAULT_CALIBRATION_PATH)
+        self.path = path
+        self._data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as calibration_file:
+                return json.load(calibration_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, section: str, key: str, default: Any = None) -> Any:
+        return self._data.get(section, {}).get(key, default)
+
+    def set(self, section: str, key: str, value: Any):
+        """Stores the value and writes the file right away"""
+        self._data.setdefault(section, {})[key] = value
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w") as calibration_file:
+            json.dump(self._data, calibration_file, indent=4)
+
+
+def get_machine_key(*extra: Any) -> str:
+    """Identifies the machine (and optionally the software etc.) the calibration was made on
+
+    Examples:
+        >>> get_machine_key("Krita").endswith("/Krita")
+        True
+    """
+    return "/".join(str(part) for part in (platform.node(), platform.system(), *extra))
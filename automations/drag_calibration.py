@@ -0,0 +1,130 @@
+import numpy as np
+
+from typing import Optional
+
+from automations.gui import pyscreeze, clock
+from automations.binary_matching import INK_THRESHOLD
+from automations.calibration_store import CalibrationStore, get_machine_key
+from automations.software_base import SoftwareBase
+from shapes.common import Point, Box
+
+# Test strokes are drawn at these lengths, capped to what fits the test area
+CALIBRATION_LENGTHS = (50, 100, 200, 400, 800)
+# Tried from the slowest to the fastest. pyautogui moves instantly with durations under 0.1
+CALIBRATION_DURATIONS = (0.3, 0.2, 0.15, 0.1, 0.0)
+
+
+class DragSpeedCurve:
+    """Shortest drag duration that still draws a freehand segment completely, by segment length.
+
+    A segment gets the duration measured for the next longer length, so only measured durations are used.
+    Interpolating between them would give durations under 0.1 that pyautogui moves instantly with.
+    Segments longer than the longest measured one get its duration, nothing beyond it is extrapolated.
+
+    Args:
+        points (list): (segment length in pixels, minimum duration in seconds) pairs
+
+    Examples:
+        >>> curve = DragSpeedCurve([(100, 0.0), (400, 0.2)])
+        >>> curve.get_duration(50), curve.get_duration(250), curve.get_duration(400)
+        (0.0, 0.2, 0.2)
+        >>> curve.get_duration(800), curve.get_duration(5000)
+        (0.2, 0.2)
+    """
+    def __init__(self, points: list[tuple[float, float]]):
+        if not points:
+            raise ValueError("Drag speed curve needs at least one point")
+        points = sorted((float(length), float(duration)) for length, duration in points)
+        self.lengths = [length for length, _ in points]
+        # A longer segment never gets a shorter duration than a shorter one
+        self.durations = [float(duration) for duration in np.maximum.accumulate([duration for _, duration in points])]
+
+    def get_duration(self, length: float) -> float:
+        if length > self.lengths[-1]:
+            return self.durations[-1]
+        return self.durations[int(np.searchsorted(self.lengths, length))]
+
+    def get_points(self) -> list[tuple[float, float]]:
+        return list(zip(self.lengths, self.durations))
+
+    @classmethod
+    def load(cls, software_name: str, store: Optional[CalibrationStore] = None) -> Optional["DragSpeedCurve"]:
+        """Curve calibrated for the software on this machine, None if not calibrated yet"""
+        store = store or CalibrationStore()
+        points = store.get("drag_speed", get_machine_key(software_name))
+        return cls(points) if points else None
+
+    def save(self, software_name: str, store: Optional[CalibrationStore] = None):
+        store = store or CalibrationStore()
+        store.set("drag_speed", get_machine_key(software_name), self.get_points())
+
+
+def is_segment_drawn(start: Point, end: Point) -> bool:
+    """Captures only the horizontal segment and checks every pixel along it is ink"""
+    left = min(start.x, end.x)
+    width = abs(end.x - start.x) + 1
+    region = (left, start.y, width, 1)
+    row = np.asarray(pyscreeze.screenshot(region=region).convert("L"))
+    return bool((row < INK_THRESHOLD).all())
+
+
+def is_segment_clean(start: Point, end: Point, brush_size: int) -> bool:
+    """Checks the area the segment's brush covers has no ink left"""
+    radius = brush_size // 2 + 1
+    left = min(start.x, end.x) - radius
+    region = (left, start.y - radius, abs(end.x - start.x) + 2 * radius + 1, 2 * radius + 1)
+    area = np.asarray(pyscreeze.screenshot(region=region).convert("L"))
+    return bool((area >= INK_THRESHOLD).all())
+
+
+def calibrate_drag_speed(
+        software: SoftwareBase,
+        area: Box,
+        lengths: tuple[int, ...] = CALIBRATION_LENGTHS,
+        durations: tuple[float, ...] = CALIBRATION_DURATIONS,
+        settle_time: float = 0.3
+        ) -> DragSpeedCurve:
+    """
+    Draws horizontal test strokes of each length with shrinking durations until one is not drawn
+    completely. The shortest duration that still drew the whole stroke is the minimum for the length.
+    Every test stroke is undone before the next, so the area has to be empty paper.
+
+    Args:
+        software (SoftwareBase): Open software with an empty drawing.
+        area (Box): Part of the drawing the test strokes are drawn in. Brush size is kept clear of its edges.
+        lengths (tuple): Tested segment lengths in pixels.
+        durations (tuple): Tested drag durations, from the slowest to the fastest.
+        settle_time (float): Wait after each stroke and undo before capturing it.
+
+    Raises:
+        RuntimeError: If even the slowest duration does not draw a stroke, or an undo does not clear it.
+    """
+    brush_size = software.get_brush_size()
+    radius = brush_size // 2 + 1
+    start = Point(area.left + radius, area.top + area.height // 2)
+    max_length = area.width - 2 * radius
+
+    points = []
+    for length in sorted(set(min(length, max_length) for length in lengths)):
+        end = Point(start.x + length, start.y)
+        minimum = None
+        for duration in sorted(durations, reverse=True):
+            software.draw_line_freehand(start, end, duration=duration)
+            clock.sleep(settle_time)
+            drawn = is_segment_drawn(start, end)
+
+            software.undo()
+            clock.sleep(settle_time)
+            if not is_segment_clean(start, end, brush_size):
+                raise RuntimeError(f"Undo did not clear the {length} px test stroke")
+
+            if not drawn:
+                break
+            minimum = duration
+
+        if minimum is None:
+            raise RuntimeError(f"{length} px stroke was not drawn completely even with {max(durations)} s duration")
+        print(f"{length} px segments need at least {minimum} s")
+        points.append((length, minimum))
+
+    return DragSpeedCurve(points)
@@ -0,0 +1,322 @@
+from PIL import Image as PILImage
+
+import statistics
+from collections import OrderedDict
+from time import perf_counter
+from typing import Optional
+
+from automations import gui
+from automations.matching import default_match_cache
+from automations.layout_cache import LayoutCache
+from automations.calibration_store import CalibrationStore, get_machine_key
+from shapes.common import Box, Point, Size
+from shapes.coverage import StrokeCoverageEstimator
+from shapes.shape import Shape
+
+# pyautogui sleeps this long after every call unless changed
+DEFAULT_PAUSE = 0.1
+# pyautogui moves instantly when the duration is shorter than this
+MINIMUM_DURATION = 0.1
+
+
+class ActionCostModel:
+    """Estimates the wall time of the actions sent to pyautogui, pyscreeze and pywinctl.
+
+    Each action costs its nominal time (the pyautogui pause, drag duration, sleep time) plus a
+    measured overhead for its type. The overheads start from rough defaults and are calibrated
+    from measured runs, see ActionTimer.
+
+    Examples:
+        >>> model = ActionCostModel({"dragTo": 0.01})
+        >>> round(model.estimate("dragTo", 0.3), 3)
+        0.31
+        >>> model.calibrate([("dragTo", 0.3, 0.35), ("dragTo", 0.3, 0.37)])
+        >>> round(model.estimate("dragTo", 0.3), 3)
+        0.36
+    """
+    default_overheads = {
+        "screenshot": 0.08,
+        "locateAll": 0.25,
+        "countAll": 0.3,
+        "getAllTitles": 0.05,
+        "write": 0.02,
+        "hotkey": 0.01,
+        "press": 0.01,
+    }
+
+    def __init__(self, overheads: Optional[dict[str, float]] = None):
+        self.overheads = dict(ActionCostModel.default_overheads)
+        if overheads:
+            self.overheads.update(overheads)
+
+    def estimate(self, action: str, nominal_seconds: float) -> float:
+        return nominal_seconds + self.overheads.get(action, 0.0)
+
+    def calibrate(self, samples: list[tuple[str, float, float]]):
+        """Sets the overhead of each action type to the median of measured minus nominal time
+
+        Args:
+            samples (list): (action, nominal seconds, measured seconds) for each measured action
+        """
+        residuals = {}
+        for action, nominal, measured in samples:
+            residuals.setdefault(action, []).append(max(0.0, measured - nominal))
+        for action, values in residuals.items():
+            self.overheads[action] = statistics.median(values)
+
+    @classmethod
+    def load(cls, store: Optional[CalibrationStore] = None) -> "ActionCostModel":
+        store = store or CalibrationStore()
+        return cls(store.get("action_costs", get_machine_key()))
+
+    def save(self, store: Optional[CalibrationStore] = None):
+        store = store or CalibrationStore()
+        store.set("action_costs", get_machine_key(), self.overheads)
+
+
+class _Recorder:
+    """Base for the stand-ins that are pushed over the gui modules while recording"""
+    def __init__(self, run: "DryRun"):
+        self._run = run
+
+
+class _DryRunPyAutoGUI(_Recorder):
+    def __init__(self, run: "DryRun"):
+        super().__init__(run)
+        self.PAUSE = DEFAULT_PAUSE
+        self.MINIMUM_DURATION = MINIMUM_DURATION
+        self._position = Point(0, 0)
+
+    def _record(self, action: str, args: tuple, duration: float = 0.0):
+        self._run.record(action, args, self.PAUSE + duration)
+
+    def position(self) -> Point:
+        return self._position
+
+    def size(self) -> Size:
+        return Size(self._run.screen.width, self._run.screen.height)
+
+    def press(self, *args, **kwargs):
+        self._record("press", args)
+
+    def hotkey(self, *args, **kwargs):
+        self._record("hotkey", args)
+
+    def write(self, message, interval: float = 0.0, **kwargs):
+        self._record("write", (message,), interval * len(message))
+
+    def click(self, *args, **kwargs):
+        self._record("click", args)
+
+    def moveTo(self, point=None, *args, duration: float = 0.0, **kwargs):
+        duration = duration if duration >= self.MINIMUM_DURATION else 0.0
+        self._record("moveTo", (point,), duration)
+        if point is not None:
+            self._position = Point(*point[:2])
+
+    def dragTo(self, point=None, *args, duration: float = 0.0, **kwargs):
+        duration = duration if duration >= self.MINIMUM_DURATION else 0.0
+        self._record("dragTo", (point,), duration)
+        if point is not None:
+            end = Point(*point[:2])
+            self._run.stroke(self._position, end)
+            self._position = end
+
+
+class _DryRunPyScreeze(_Recorder):
+    class ImageNotFoundException(Exception):
+        pass
+
+    def screenshot(self, *args, region=None, **kwargs):
+        self._run.record("screenshot", (region,), 0.0)
+        size = (region[2], region[3]) if region else (self._run.screen.width, self._run.screen.height)
+        return PILImage.new("RGB", size, (255, 255, 255))
+
+    def locateAll(self, needle, haystack, limit: int = 10000, **kwargs):
+        self._run.record("locateAll", (getattr(needle, "size", None),), 0.0)
+        # Waits only want the first match and are assumed to find their UI element at once.
+        # Counts get the shapes the coverage model still considers intact
+        if limit == 1:
+            return [self._run.canvas]
+        return [self._run.canvas] * self._run.intact_shape_count()
+
+    def countAll(self, needles, haystack, **kwargs):
+        self._run.record("countAll", (len(needles),), 0.0)
+        return [self._run.intact_shape_count()] * len(needles)
+
+
+class _DryRunPyWinCtl(_Recorder):
+    def getAllTitles(self) -> list[str]:
+        self._run.record("getAllTitles", (), 0.0)
+        return []
+
+
+class _DryRunClock(_Recorder):
+    def sleep(self, seconds: float):
+        self._run.record("sleep", (seconds,), seconds)
+
+
+class DryRun:
+    """Walks through a run without touching the screen and estimates how long it would take.
+
+    While active, the gui modules are replaced with recorders. Every action is recorded with its
+    phase and estimated cost. Locate waits are assumed to succeed on the first try, and their
+    timeouts are kept for the worst case estimate. Counts of the tracked shapes are answered with
+    a stroke coverage model, so the erasure loop ends like it would on the screen. The recorded
+    screenshots never change and the locates are made up, so the match and layout caches are
+    turned off while recording.
+
+    Args:
+        cost_model (ActionCostModel, optional): Defaults to the calibrated model of this machine.
+        screen (Size): Size of the simulated screen.
+        canvas (Box): What the simulated locates return, the drawing area of the software.
+    """
+    def __init__(self, cost_model: Optional[ActionCostModel] = None, screen: Size = Size(2560, 1440), canvas: Optional[Box] = None):
+        self.cost_model = cost_model or ActionCostModel.load()
+        self.screen = screen
+        self.canvas = canvas or Box(0, 0, screen.width, screen.height)
+        self.actions: list[dict] = []
+        self.current_phase = "Setup"
+        self._estimator: Optional[StrokeCoverageEstimator] = None
+        self._brush_size = 0
+        self._recorders = [
+            (gui.pyautogui, _DryRunPyAutoGUI(self)),
+            (gui.pyscreeze, _DryRunPyScreeze(self)),
+            (gui.pywinctl, _DryRunPyWinCtl(self)),
+            (gui.clock, _DryRunClock(self)),
+        ]
+
+    def __enter__(self) -> "DryRun":
+        for module, recorder in self._recorders:
+            module.push_override(recorder)
+        gui.add_observer(self._on_event)
+        self._caches_enabled = (default_match_cache.enabled, LayoutCache.enabled)
+        default_match_cache.enabled = LayoutCache.enabled = False
+        return self
+
+    def __exit__(self, *exc_info):
+        default_match_cache.enabled, LayoutCache.enabled = self._caches_enabled
+        gui.remove_observer(self._on_event)
+        for module, _ in self._recorders:
+            module.pop_override()
+
+    def _on_event(self, event: str, details: dict):
+        if event == "phase_start":
+            self.current_phase = details["name"]
+        elif event == "wait":
+            self.actions.append({
+                "phase": self.current_phase, "action": "wait", "args": (details["image"],),
+                "seconds": 0.0, "worst_seconds": details["timeout"]
+            })
+
+    def record(self, action: str, args: tuple, nominal_seconds: float):
+        seconds = self.cost_model.estimate(action, nominal_seconds)
+        self.actions.append({
+            "phase": self.current_phase, "action": action, "args": args,
+            "seconds": seconds, "worst_seconds": seconds
+        })
+
+    def track_shapes(self, shapes: list[Shape], brush_size: int, confidence: float):
+        """Counts made after this are answered with the shapes the erasure strokes have not broken"""
+        self._estimator = StrokeCoverageEstimator(shapes, confidence=confidence)
+        self._brush_size = brush_size
+
+    def stroke(self, start: Point, end: Point):
+        if self._estimator is not None:
+            self._estimator.add_stroke([start, end], self._brush_size)
+
+    def intact_shape_count(self) -> int:
+        if self._estimator is None:
+            return 0
+        return sum(not self._estimator.is_predicted_broken(index) for index in range(len(self._estimator.shapes)))
+
+    def estimate_by_phase(self) -> "OrderedDict[str, tuple[int, float, float]]":
+        """Phase -> (action count, expected seconds, worst case seconds)"""
+        phases = OrderedDict()
+        for action in self.actions:
+            count, seconds, worst = phases.get(action["phase"], (0, 0.0, 0.0))
+            phases[action["phase"]] = (count + 1, seconds + action["seconds"], worst + action["worst_seconds"])
+        return phases
+
+    def print_report(self, list_actions: bool = True):
+        if list_actions:
+            print("PLANNED ACTIONS".center(70, "-"))
+            for action in self.actions:
+                print(f"{action['phase']:<24}{action['action']:<14}{action['seconds']:>7.3f}s  {action['args']}")
+
+        print("ESTIMATE".center(70, "-"))
+        total_seconds = total_worst = 0.0
+        for phase, (count, seconds, worst) in self.estimate_by_phase().items():
+            total_seconds += seconds
+            total_worst += worst
+            print(f"{phase:<32}{count:>6} actions {seconds:>9.2f}s (worst {worst:.2f}s)")
+        print(f"{'Total':<46}{total_seconds:>9.2f}s (worst {total_worst:.2f}s)")
+
+
+class ActionTimer:
+    """Measures the real actions of a run to calibrate the ActionCostModel.
+
+    Wraps the gui modules, times every call and stores (action, nominal seconds, measured seconds).
+    """
+    # Module name -> timed functions
+    timed_actions = {
+        "pyautogui": ("press", "hotkey", "write", "click", "moveTo", "dragTo"),
+        "pyscreeze": ("screenshot", "locateAll", "countAll"),
+        "pywinctl": ("getAllTitles",),
+        "time": ("sleep",),
+    }
+
+    def __init__(self):
+        self.samples: list[tuple[str, float, float]] = []
+        self._modules = [gui.pyautogui, gui.pyscreeze, gui.pywinctl, gui.clock]
+
+    def __enter__(self) -> "ActionTimer":
+        for module in self._modules:
+            module.push_override(_TimedModule(self, module.target(), self.timed_actions[module.module_name]))
+        return self
+
+    def __exit__(self, *exc_info):
+        for module in self._modules:
+            module.pop_override()
+
+    def nominal_seconds(self, action: str, args: tuple, kwargs: dict, pause: float) -> float:
+        if action == "sleep":
+            return args[0]
+        duration = kwargs.get("duration", 0.0)
+        if action in ("moveTo", "dragTo") and duration < MINIMUM_DURATION:
+            duration = 0.0
+        if action in ("press", "hotkey", "write", "click", "moveTo", "dragTo"):
+            return pause + duration
+        return 0.0
+
+    def calibrate(self, cost_model: ActionCostModel):
+        cost_model.calibrate(self.samples)
+
+
+class _TimedModule:
+    def __init__(self, timer: ActionTimer, inner, actions: tuple[str, ...]):
+        object.__setattr__(self, "_timer", timer)
+        object.__setattr__(self, "_inner", inner)
+        object.__setattr__(self, "_actions", actions)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._inner, name)
+        if name not in self._actions:
+            return attribute
+
+        def timed(*args, **kwargs):
+            pause = getattr(self._inner, "PAUSE", 0.0)
+            start = perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+                if name == "locateAll":
+                    # Matching runs lazily while the generator is consumed
+                    result = list(result)
+            finally:
+                measured = perf_counter() - start
+                self._timer.samples.append((name, self._timer.nominal_seconds(name, args, kwargs, pause), measured))
+            return result
+        return timed
+
+    def __setattr__(self, name: str, value):
+        setattr(self._inner, name, value)
@@ -0,0 +1,147 @@
+import numpy as np
+
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Sequence, Union
+
+from automations import gui
+from automations.ink_prefilter import get_window_sums
+from automations.tiled_matching import load_cv2_image
+
+
+class FrameSpectrum:
+    """Fourier transform and integral images of one frame, shared by every template matched against it.
+
+    Correlation with a template is a product in the frequency domain, so each template costs one inverse
+    transform instead of a full scan of the frame. The frame is zero padded to a size the transform is
+    fast for. The padding is never read by the positions where the template fits in the frame.
+    Transforms are in single precision like in cv2.matchTemplate, and the frame mean is taken out first
+    to keep the rounding small. A constant does not change the correlation with a zero mean template.
+
+    Args:
+        frame (np.ndarray): Grayscale (height, width) or color (height, width, channels) pixels.
+    """
+    def __init__(self, frame: np.ndarray):
+        import cv2
+        self.height, self.width = frame.shape[:2]
+        channels = frame.reshape(self.height, self.width, -1)
+        self.padded_shape = (cv2.getOptimalDFTSize(self.height), cv2.getOptimalDFTSize(self.width))
+        self.spectra = []
+        # Sums and squared sums of the pixels, for the deviation of every window
+        self.integrals = []
+        for channel in range(channels.shape[2]):
+            pixels = np.ascontiguousarray(channels[:, :, channel])
+            self.integrals.append(cv2.integral2(pixels, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F))
+            self.spectra.append(cv2.dft(self._pad(pixels.astype(np.float32) - float(pixels.mean()))))
+        self._window_deviations: dict[tuple[int, int], np.ndarray] = {}
+
+    def _pad(self, pixels: np.ndarray) -> np.ndarray:
+        padded = np.zeros(self.padded_shape, dtype=np.float32)
+        padded[:pixels.shape[0], :pixels.shape[1]] = pixels
+        return padded
+
+    def get_template_spectrum(self, template: np.ndarray) -> tuple[list[np.ndarray], float]:
+        """Spectra of the zero mean template channels at the padded frame size, and the template's norm"""
+        import cv2
+        height, width = template.shape[:2]
+        channels = template.reshape(height, width, -1).astype(np.float64)
+        channels = channels - channels.mean(axis=(0, 1))
+        spectra = [cv2.dft(self._pad(channels[:, :, channel].astype(np.float32))) for channel in range(channels.shape[2])]
+        return spectra, float(np.sqrt((channels ** 2).sum()))
+
+    def get_window_deviations(self, height: int, width: int) -> np.ndarray:
+        """Square root of the summed squared deviations of every window, shared by the templates of the same size"""
+        if (height, width) not in self._window_deviations:
+            area = height * width
+            variance = np.zeros((self.height - height + 1, self.width - width + 1))
+            for sums, squared_sums in self.integrals:
+                window_sums = get_window_sums(sums, height, width)
+                variance += get_window_sums(squared_sums, height, width) - window_sums * window_sums / area
+            self._window_deviations[(height, width)] = np.sqrt(np.maximum(variance, 0))
+        return self._window_deviations[(height, width)]
+
+    def count_above(self, template_shape: tuple[int, int], template_spectrum: tuple[list[np.ndarray], float], confidence: float) -> int:
+        """Positions where the normalized correlation coefficient is above the confidence, like cv2.TM_CCOEFF_NORMED"""
+        import cv2
+        height, width = template_shape
+        spectra, template_norm = template_spectrum
+        product = cv2.mulSpectrums(self.spectra[0], spectra[0], 0, conjB=True)
+        for frame, template in zip(self.spectra[1:], spectra[1:]):
+            product += cv2.mulSpectrums(frame, template, 0, conjB=True)
+        numerator = cv2.idft(product, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)[:self.height - height + 1, :self.width - width + 1]
+
+        denominator = self.get_window_deviations(height, width) * template_norm
+        # Flat windows do not correlate with anything, as in OpenCV
+        matched = (numerator > confidence * denominator) & (denominator > 1e-6 * template_norm * template_norm)
+        return int(np.count_nonzero(matched))
+
+
+class FFTMatcher(gui.PyScreezeOverride):
+    """Stand-in for pyscreeze that counts several templates from one frame with a shared Fourier transform.
+
+    countAll transforms the frame once and scores every template with one inverse transform. The template
+    transforms are kept for the next frames of the same size, up to max_templates of them. Counts have the
+    semantics of pyscreeze.locateAll, every position above the confidence. Rounding differs from OpenCV's,
+    so a score can differ from it in the fifth decimal.
+
+    Args:
+        max_templates (int): Template transforms kept. Each one takes 4 bytes per frame pixel and channel.
+
+    Examples:
+        Counts agree with pyscreeze at the confidences the squares are counted with, and below them:
+            >>> import pyscreeze
+            >>> from PIL import Image, ImageDraw
+            >>> haystack = Image.new("RGB", (240, 160), "white")
+            >>> draw = ImageDraw.Draw(haystack)
+            >>> for left, width in [(10, 3), (70, 3), (130, 4), (190, 2)]:
+            ...     draw.rectangle((left, 10, left + 30, 40), outline="black", width=width)
+            ...     draw.ellipse((left, 90, left + 40, 130), outline="black", width=width)
+            >>> needles = [haystack.crop((8, 8, 43, 43)), haystack.crop((8, 88, 53, 133))]
+            >>> matcher = FFTMatcher()
+            >>> gui.pyscreeze.push_override(matcher)
+            >>> counts = [matcher.countAll(needles, haystack, grayscale=False, confidence=confidence) for confidence in ([0.98, 0.99], 0.8)]
+            >>> gui.pyscreeze.pop_override()
+            >>> counts
+            [[2, 2], [3, 3]]
+            >>> counts == [[len(list(pyscreeze.locateAll(needle, haystack, confidence=confidence))) for needle, confidence in zip(needles, confidences)] for confidences in ([0.98, 0.99], [0.8, 0.8])]
+            True
+    """
+    own_attributes = ("max_templates",)
+
+    def __init__(self, max_templates: int = 4):
+        self.max_templates = max_templates
+        self._template_spectra = OrderedDict()
+
+    def countAll(self, needleImages: list, haystackImage, grayscale: Optional[bool] = None, confidence: Union[float, Sequence[float]] = 0.999, limit: int = 10000) -> list[int]:
+        """
+        Number of positions each needle matches the haystack with more than the confidence.
+        Confidence can be given for each needle separately
+        """
+        if grayscale is None:
+            grayscale = self._inner.GRAYSCALE_DEFAULT
+        confidences = [confidence] * len(needleImages) if isinstance(confidence, (int, float)) else list(confidence)
+
+        frame = FrameSpectrum(load_cv2_image(haystackImage, grayscale))
+        counts = []
+        for needleImage, needle_confidence in zip(needleImages, confidences):
+            needle = load_cv2_image(needleImage, grayscale)
+            if needle.shape[0] > frame.height or needle.shape[1] > frame.width:
+                counts.append(0)
+                continue
+            found = frame.count_above(needle.shape[:2], self.get_template_spectrum(needle, frame), needle_confidence)
+            counts.append(min(limit, found))
+        return counts
+
+    def get_template_spectrum(self, needle: np.ndarray, frame: FrameSpectrum) -> tuple[list[np.ndarray], float]:
+        key = (hashlib.blake2b(np.ascontiguousarray(needle).tobytes(), digest_size=16).hexdigest(), needle.shape, frame.padded_shape)
+        if key in self._template_spectra:
+            self._template_spectra.move_to_end(key)
+            return self._template_spectra[key]
+        spectrum = frame.get_template_spectrum(needle)
+        self._template_spectra[key] = spectrum
+        while len(self._template_spectra) > self.max_templates:
+            self._template_spectra.popitem(last=False)
+        return spectrum
+
+    def clear(self):
+        self._template_spectra.clear()
@@ -0,0 +1,137 @@
+import importlib
+from contextlib import contextmanager
+from typing import Callable
+
+
+class LazyModule:
+    """Stand-in for a module that is imported only when one of its attributes is first used.
+
+    The GUI, capture and OpenCV stacks are slow to import and need a display, so they are not imported
+    when only planning, parsing arguments or running the doctests.
+
+    Other objects can be pushed over the module, for example to record the actions instead of
+    sending them. The latest pushed override gets all the attribute accesses.
+
+    Examples:
+        >>> json = LazyModule("json")
+        >>> json.dumps([1])
+        '[1]'
+
+        >>> class Recorder:
+        ...     def dumps(self, value):
+        ...         return "recorded"
+        >>> json.push_override(Recorder())
+        >>> json.dumps([1])
+        'recorded'
+        >>> json.pop_override()
+        >>> json.dumps([1])
+        '[1]'
+    """
+    def __init__(self, module_name: str):
+        object.__setattr__(self, "_module_name", module_name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_overrides", [])
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, "_module", importlib.import_module(self._module_name))
+        return self._module
+
+    @property
+    def module_name(self) -> str:
+        return self._module_name
+
+    def target(self):
+        """The object the attribute accesses currently go to"""
+        if self._overrides:
+            return self._overrides[-1]
+        return self._load()
+
+    def target_under(self, override):
+        """The object the given pushed override sits on top of"""
+        index = next(index for index, pushed in enumerate(self._overrides) if pushed is override)
+        if index > 0:
+            return self._overrides[index - 1]
+        return self._load()
+
+    def push_override(self, override):
+        self._overrides.append(override)
+
+    def pop_override(self):
+        self._overrides.pop()
+
+    def __getattr__(self, name: str):
+        # Introspection (doctest collection, copy, pickle) must not trigger the import
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+        return getattr(self.target(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.target(), name, value)
+
+
+pyautogui = LazyModule("pyautogui")
+pyscreeze = LazyModule("pyscreeze")
+pywinctl = LazyModule("pywinctl") # Some pyautogui functions are unavailabel on linux systems
+clock = LazyModule("time") # Sleeps go through here, so a dry run does not actually wait
+
+
+class PyScreezeOverride:
+    """Base of the matchers pushed over pyscreeze that handle some calls themselves and pass the rest on.
+
+    Anything pushed later (dry runs, timers, tracers) still sees one call for each search, however the
+    matchers under it split the work. Attributes in own_attributes and private ones are kept on the
+    override. Every other attribute is read from and set on the pyscreeze under it.
+    """
+    own_attributes: tuple[str, ...] = ()
+
+    @property
+    def _inner(self):
+        return pyscreeze.target_under(self)
+
+    def __getattr__(self, name: str):
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+        return getattr(self._inner, name)
+
+    def __setattr__(self, name: str, value):
+        if name in self.own_attributes or name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._inner, name, value)
+
+#
+#   EVENTS
+#
+_observers: list[Callable[[str, dict], None]] = []
+
+def add_observer(observer: Callable[[str, dict], None]):
+    """Observer gets every event sent with notify as observer(event, details)"""
+    _observers.append(observer)
+
+def remove_observer(observer: Callable[[str, dict], None]):
+    _observers.remove(observer)
+
+def notify(event: str, **details):
+    """Sends an event, like the start of a wait with its timeout, to the observers"""
+    for observer in _observers:
+        observer(event, details)
+
+@contextmanager
+def span(name: str, **details):
+    """Marks one traced operation, e.g. a template match with its template and confidence.
+    Results can be added to the yielded details inside the block, they are sent with the end event"""
+    notify("span_start", name=name, details=details)
+    try:
+        yield details
+    finally:
+        notify("span_end", name=name, details=details)
+
+@contextmanager
+def phase(name: str):
+    """Marks the actions inside the block as one phase of the run, e.g. "Drawing squares" """
+    notify("phase_start", name=name)
+    try:
+        yield
+    finally:
+        notify("phase_end", name=name)
@@ -0,0 +1,138 @@
+import numpy as np
+
+from typing import Optional
+
+from automations import gui
+from automations.binary_matching import INK_THRESHOLD
+from automations.tiled_matching import load_cv2_image
+from shapes.common import Box
+
+
+class InkCountPrefilter(gui.PyScreezeOverride):
+    """Stand-in for pyscreeze that skips the windows whose amount of ink already rules out a match.
+
+    Called with prefilter=True, the dark pixels of the frame are counted into an integral image once,
+    which gives the ink count of any template sized window with four lookups. A window can only correlate
+    with the template as well as its ink count allows: with a different amount of ink, some pixels have
+    to differ. The counts that could still reach the confidence, less score_margin for the anti-aliased
+    edges, are worked out from the template once, and every other window is rejected without correlating.
+    On blank paper that is nearly every window. Correlation is then run only over the rows and columns
+    that still have windows left, and only matches at those windows are returned.
+
+    The bound holds for pure black and white pixels. Anti-aliased and blurred strokes can correlate above the
+    confidence with an ink count outside it, so the prefilter can miss matches pyscreeze finds. It is only
+    used where a calibrated match profile found the counts exact, see match_calibration.
+
+    If less than min_rejected of the windows are rejected, the whole frame is correlated as usual.
+    Without prefilter=True the call goes to pyscreeze untouched.
+
+    Args:
+        score_margin (float): How much lower the correlation of pure black and white windows can be than the confidence.
+        min_rejected (float): Share of the windows that has to be rejected for the prefilter to be used.
+    """
+    own_attributes = ("score_margin", "min_rejected", "rejected", "windows")
+
+    def __init__(self, score_margin: float = 0.05, min_rejected: float = 0.5):
+        self.score_margin = score_margin
+        self.min_rejected = min_rejected
+        self.rejected = 0
+        self.windows = 0
+
+    def locateAll(self, needleImage, haystackImage, grayscale: Optional[bool] = None, limit: int = 10000, region=None, step: int = 1, confidence: float = 0.999, prefilter: bool = False):
+        """Same arguments and results as pyscreeze.locateAll. With prefilter=True the windows are counted first"""
+        inner = self._inner
+        if grayscale is None:
+            grayscale = inner.GRAYSCALE_DEFAULT
+        if not prefilter or region is not None or step != 1:
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, region=region, step=step, confidence=confidence)
+
+        import cv2
+        needle = load_cv2_image(needleImage, grayscale)
+        haystack = load_cv2_image(haystackImage, grayscale)
+        needle_ink = needle if grayscale else cv2.cvtColor(needle, cv2.COLOR_BGR2GRAY)
+        needle_ink = int((needle_ink < INK_THRESHOLD).sum())
+        needle_height, needle_width = needle.shape[:2]
+        area = needle_height * needle_width
+        too_large = needle_height > haystack.shape[0] or needle_width > haystack.shape[1]
+        if too_large or needle_ink in (0, area):
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, confidence=confidence)
+
+        haystack_gray = haystack if grayscale else cv2.cvtColor(haystack, cv2.COLOR_BGR2GRAY)
+        ink_counts = get_window_ink_counts(haystack_gray < INK_THRESHOLD, needle.shape[:2])
+        lowest, highest = get_possible_ink_counts(needle_ink, area, confidence - self.score_margin)
+        passed = (ink_counts >= lowest) & (ink_counts <= highest)
+
+        rejected = int(passed.size - np.count_nonzero(passed))
+        if rejected < passed.size * self.min_rejected:
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, confidence=confidence)
+        self.rejected += rejected
+        self.windows += passed.size
+
+        matches = []
+        for top, bottom in _get_row_runs(passed.any(axis=1)):
+            columns = np.nonzero(passed[top:bottom].any(axis=0))[0]
+            left, right = int(columns[0]), int(columns[-1]) + 1
+            scores = cv2.matchTemplate(
+                haystack[top:bottom + needle_height - 1, left:right + needle_width - 1], needle, cv2.TM_CCOEFF_NORMED
+            )
+            ys, xs = np.nonzero((scores > confidence) & passed[top:bottom, left:right])
+            matches.extend((int(y) + top, int(x) + left) for y, x in zip(ys, xs))
+            if len(matches) >= limit:
+                break
+        matches = matches[:limit]
+
+        if not matches and getattr(inner, "USE_IMAGE_NOT_FOUND_EXCEPTION", True):
+            raise inner.ImageNotFoundException("Could not locate the image")
+        return [Box(x, y, needle_width, needle_height) for y, x in matches]
+
+
+def get_window_ink_counts(ink: np.ndarray, window_shape: tuple[int, int]) -> np.ndarray:
+    """
+    Ink pixels in the window at every position, from one integral image of the ink mask
+
+    Examples:
+        >>> ink = np.zeros((4, 5), dtype=bool)
+        >>> ink[1:3, 1:3] = True
+        >>> get_window_ink_counts(ink, (2, 2)).tolist()
+        [[1, 2, 1, 0], [2, 4, 2, 0], [1, 2, 1, 0]]
+    """
+    import cv2
+    return get_window_sums(cv2.integral(ink.astype(np.uint8)), *window_shape)
+
+
+def get_window_sums(integral: np.ndarray, height: int, width: int) -> np.ndarray:
+    """
+    Sums of the height by width windows at every position, from an integral image with a leading zero row and column
+
+    Examples:
+        >>> integral = np.pad(np.arange(1, 7).reshape(2, 3).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        >>> get_window_sums(integral, 2, 2).tolist()
+        [[12, 16]]
+    """
+    return integral[height:, width:] - integral[:-height, width:] - integral[height:, :-width] + integral[:-height, :-width]
+
+
+def get_possible_ink_counts(needle_ink: int, area: int, min_score: float) -> tuple[int, int]:
+    """
+    Lowest and highest window ink count that can still correlate with the template at least min_score.
+    Pure black and white window correlates best when its ink covers the template's or the other way around.
+
+    Examples:
+        >>> get_possible_ink_counts(100, 1000, 0.9)
+        (83, 120)
+        >>> get_possible_ink_counts(100, 1000, 0.0)
+        (1, 999)
+    """
+    window_ink = np.arange(1, area, dtype=np.float64)
+    shared = np.minimum(window_ink, needle_ink)
+    best_scores = (area * shared - needle_ink * window_ink) / np.sqrt(
+        needle_ink * (area - needle_ink) * window_ink * (area - window_ink)
+    )
+    possible = window_ink[best_scores >= min_score]
+    return int(possible[0]), int(possible[-1])
+
+
+def _get_row_runs(rows: np.ndarray) -> list[tuple[int, int]]:
+    """(start, end) of each run of True rows"""
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    return list(zip(np.nonzero(edges == 1)[0].tolist(), np.nonzero(edges == -1)[0].tolist()))
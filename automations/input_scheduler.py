@@ -0,0 +1,283 @@
+from typing import Callable, Optional
+
+from automations import gui
+from shapes.common import Point
+
+
+class InputScheduler:
+    """Queues the input actions, drops the redundant ones and paces them with adaptive pauses.
+
+    pyautogui sleeps its global PAUSE after every call. The scheduler sends the actions with the
+    pause turned off and sleeps its own pause for each action type instead. The pauses shrink every
+    time the UI is seen to have kept up (a wait finds its element on the first poll) and back off
+    when it has not. A PAUSE the caller sets under pyautogui's own, like the shorter pause of a drawing
+    batch, is the most the actions queued while it is set wait. So the batch is not slower than without the scheduler.
+
+    Queued actions are sent before anything reads the screen, asks for window titles or sleeps,
+    so the order of input and checks stays the same.
+
+    Redundant actions dropped:
+        - A press or hotkey of an idempotent key combination, e.g. selecting the tool that is already selected
+        - A moveTo to where the mouse already is, or that is immediately followed by another moveTo
+
+    Args:
+        initial_pause (float): Starting pause for every action type.
+        min_pause (float): Pauses never go lower than this.
+        max_pause (float): Pauses never go higher than this.
+        speedup (float): Pause multiplier after the UI kept up.
+        backoff (float): Pause multiplier after the UI fell behind.
+        idempotent_keys (iterable): Key combinations that are safe to drop when sent twice in a row.
+
+    Examples:
+        >>> class Keyboard:
+        ...     PAUSE = 0.1
+        ...     def __init__(self):
+        ...         self.sent = []
+        ...     def press(self, key):
+        ...         self.sent.append(key)
+        ...     def moveTo(self, point, duration=0.0):
+        ...         self.sent.append(point)
+        >>> class Clock:
+        ...     def sleep(self, seconds):
+        ...         pass
+        >>> keyboard = Keyboard()
+        >>> scheduler = InputScheduler(idempotent_keys=[("b",)])
+        >>> scheduler.install(keyboard, clock=Clock())
+        >>> gui.pyautogui.press("b"); gui.pyautogui.moveTo((1, 1)); gui.pyautogui.press("b"); gui.pyautogui.moveTo((1, 1))
+        >>> scheduler.flush()
+        True
+        >>> keyboard.sent
+        ['b', (1, 1)]
+        >>> scheduler.uninstall()
+    """
+    queued_actions = ("press", "hotkey", "write", "click", "moveTo", "dragTo", "mouseDown", "mouseUp", "keyDown", "keyUp")
+
+    def __init__(
+            self,
+            initial_pause: float = 0.1,
+            min_pause: float = 0.02,
+            max_pause: float = 0.5,
+            speedup: float = 0.8,
+            backoff: float = 2.0,
+            idempotent_keys=()
+            ):
+        self.initial_pause = initial_pause
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.speedup = speedup
+        self.backoff = backoff
+        self.idempotent_keys: set[tuple[str, ...]] = set(tuple(keys) for keys in idempotent_keys)
+
+        self.pauses: dict[str, float] = {}
+        self.dropped_actions = 0
+        self.sent_actions = 0
+
+        self._queue: list[tuple[str, tuple, dict, Optional[float]]] = []
+        # PAUSE set by the caller, None until one is set
+        self.pause_ceiling: Optional[float] = None
+        self._flushing = False
+        self._last_keys: Optional[tuple[str, ...]] = None
+        self._position: Optional[Point] = None
+        self._last_flushed_types: set[str] = set()
+        self._installed: list[tuple[gui.LazyModule, object]] = []
+        self._explicit_inner = None
+        self._explicit_clock = None
+
+    #
+    #   INSTALLING
+    #
+    def install(self, inner=None, clock=None):
+        """Puts the scheduler between the code and the current pyautogui target
+
+        Args:
+            inner (optional): Where the actions are sent. Defaults to what gui.pyautogui pointed to
+            clock (optional): What sleeps the pauses. Defaults to what gui.clock pointed to
+        """
+        self._explicit_inner = inner
+        self._explicit_clock = clock
+
+        override = _ScheduledPyAutoGUI(self)
+        gui.pyautogui.push_override(override)
+        self._installed.append((gui.pyautogui, override))
+        # Anything that reads the screen, the windows or waits has to see the queued input sent first
+        for module in (gui.pyscreeze, gui.pywinctl, gui.clock):
+            override = _FlushingModule(self, module)
+            module.push_override(override)
+            self._installed.append((module, override))
+        gui.add_observer(self._on_event)
+
+    def uninstall(self):
+        try:
+            self.flush()
+        finally:
+            gui.remove_observer(self._on_event)
+            for module, _ in reversed(self._installed):
+                module.pop_override()
+            self._installed = []
+
+    @property
+    def _inner(self):
+        if self._explicit_inner is not None:
+            return self._explicit_inner
+        module, override = self._installed[0]
+        return module.target_under(override)
+
+    @property
+    def _inner_clock(self):
+        if self._explicit_clock is not None:
+            return self._explicit_clock
+        module, override = self._installed[-1]
+        return module.target_under(override)
+
+    #
+    #   QUEUE
+    #
+    def queue(self, action: str, args: tuple, kwargs: dict):
+        if self._is_redundant(action, args, kwargs):
+            self.dropped_actions += 1
+            return
+        self._queue.append((action, args, kwargs, self.pause_ceiling))
+
+    def flush(self, check: Optional[Callable[[], bool]] = None) -> bool:
+        """Sends the queued actions. If check is given, it verifies the UI kept up and adapts the pauses
+
+        Returns:
+            bool: Result of the check, True without one
+        """
+        if self._flushing or not self._queue:
+            return check() if check is not None else True
+
+        self._flushing = True
+        queue, self._queue = self._queue, []
+        default_pause = self._inner.PAUSE
+        self._inner.PAUSE = 0
+        try:
+            for action, args, kwargs, ceiling in queue:
+                getattr(self._inner, action)(*args, **kwargs)
+                self.sent_actions += 1
+                pause = self.get_pause(action)
+                self._inner_clock.sleep(pause if ceiling is None else min(pause, ceiling))
+        finally:
+            self._inner.PAUSE = default_pause
+            self._flushing = False
+        self._last_flushed_types = {action for action, _, _, _ in queue}
+
+        if check is None:
+            return True
+        success = check()
+        self.acknowledge(success)
+        return success
+
+    #
+    #   PAUSES
+    #
+    def get_pause(self, action: str) -> float:
+        return self.pauses.get(action, self.initial_pause)
+
+    def acknowledge(self, success: bool):
+        """Adapts the pauses of the last sent action types by whether the UI kept up with them"""
+        for action in self._last_flushed_types:
+            if success:
+                self.pauses[action] = max(self.min_pause, self.get_pause(action) * self.speedup)
+            else:
+                self.pauses[action] = min(self.max_pause, self.get_pause(action) * self.backoff)
+        self._last_flushed_types = set()
+
+    def _on_event(self, event: str, details: dict):
+        if event == "wait_result":
+            # A miss of an optional wait is the UI being in another state, not the UI lagging behind
+            if details["found"] or not details.get("optional"):
+                self.acknowledge(details["found"] and details["polls"] == 1)
+        elif event == "phase_end":
+            # Input of a phase is sent within the phase, so timings and traces stay attributed to it
+            self.flush()
+
+    #
+    #   COALESCING
+    #
+    def _is_redundant(self, action: str, args: tuple, kwargs: dict) -> bool:
+        if action in ("press", "hotkey"):
+            keys = tuple(args[0]) if action == "press" and isinstance(args[0], (list, tuple)) else tuple(args)
+            redundant = keys in self.idempotent_keys and keys == self._last_keys
+            self._last_keys = keys
+            return redundant
+
+        if action in ("write", "keyDown", "keyUp", "click", "mouseDown", "mouseUp"):
+            # Typing or clicking can move the focus or change the tool
+            self._last_keys = None
+            if action in ("click", "mouseDown", "mouseUp"):
+                self._position = _get_target_point(args, kwargs) or self._position
+            return False
+
+        if action == "moveTo":
+            target = _get_target_point(args, kwargs)
+            instant = kwargs.get("duration", 0.0) == 0.0
+            if target is not None and target == self._position and instant:
+                return True
+            if instant and self._queue and self._queue[-1][0] == "moveTo" and self._queue[-1][2].get("duration", 0.0) == 0.0:
+                # The earlier move would be overridden right away
+                self._queue.pop()
+                self.dropped_actions += 1
+            self._position = target
+            return False
+
+        if action == "dragTo":
+            self._position = _get_target_point(args, kwargs)
+        return False
+
+
+def _get_target_point(args: tuple, kwargs: dict) -> Optional[Point]:
+    """Point given to a pyautogui mouse function as (point) or (x, y)"""
+    x = args[0] if args else kwargs.get("x")
+    y = args[1] if len(args) > 1 else kwargs.get("y")
+    if isinstance(x, (tuple, list)):
+        return Point(*x[:2])
+    if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+        return Point(x, y)
+    return None
+
+
+class _ScheduledPyAutoGUI:
+    def __init__(self, scheduler: InputScheduler):
+        object.__setattr__(self, "_scheduler", scheduler)
+
+    def __getattr__(self, name: str):
+        scheduler = self._scheduler
+        if name in InputScheduler.queued_actions:
+            def queued(*args, **kwargs):
+                scheduler.queue(name, args, kwargs)
+            return queued
+        # Anything else, like position(), needs the queued actions sent first
+        scheduler.flush()
+        return getattr(scheduler._inner, name)
+
+    def __setattr__(self, name: str, value):
+        if name == "PAUSE":
+            # The scheduler's own pauses replace the global one, up to the pause the caller asked for
+            # Setting it back to pyautogui's own pause removes the ceiling
+            self._scheduler.pause_ceiling = value if value < self._scheduler._inner.PAUSE else None
+            return
+        setattr(self._scheduler._inner, name, value)
+
+
+class _FlushingModule:
+    def __init__(self, scheduler: InputScheduler, module: gui.LazyModule):
+        object.__setattr__(self, "_scheduler", scheduler)
+        object.__setattr__(self, "_module", module)
+
+    @property
+    def _inner(self):
+        return self._module.target_under(self)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._inner, name)
+        if not callable(attribute) or isinstance(attribute, type):
+            return attribute
+
+        def flushed(*args, **kwargs):
+            self._scheduler.flush()
+            return attribute(*args, **kwargs)
+        return flushed
+
+    def __setattr__(self, name: str, value):
+        setattr(self._inner, name, value)
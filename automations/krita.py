@@ -1,13 +1,26 @@
-import pyautogui as pya
-from pyscreeze import ImageNotFoundException, Point
-
+from automations.gui import pyautogui as pya, span
 from automations.software_base import SoftwareBase
+from automations.matching import locate_on_screen, locate_center_on_screen
+from automations.drag_calibration import DragSpeedCurve
+from automations.rectangle_calibration import RectangleToolCorrection
 from shapes.square import Square
-from shapes.common import Size
+from shapes.common import Point, Size, distance_between_points, order_strokes_for_short_travel
+
+import subprocess
+from typing import Optional
 
 class Krita(SoftwareBase):
     # Freehand moves too fast with 0.1 duration with pyautogui.dragTo()
+    # Used for every segment until the drag speed is calibrated, see drag_calibration.py
     freehand_draw_speed = 0.2
+    # Pause between the pyautogui calls of a batch. Drags already take their duration, so the default 0.1 is not needed
+    batch_action_pause = 0.05
+    # Only the start and end of a rectangle tool drag matter
+    rectangle_drag_duration = 0.1
+    # Tool selections, sending them again while the tool is selected does nothing
+    idempotent_keys = (("b",), ("shift", "r"))
+    # Asked from krita once per process, see get_software_version
+    software_version: Optional[str] = None
     def __init__(self, screenshots_directory: str) -> None:
         self.scr_directories = {
             "base": screenshots_directory,
@@ -18,10 +31,22 @@ class Krita(SoftwareBase):
 
         self.software_name = "Krita"
         self.brush_size = 40
+        self.drag_speed_curve = DragSpeedCurve.load(self.software_name)
+        self.rectangle_correction = RectangleToolCorrection.load(self.software_name)
 
     #
     #   BASICS
     #
+    def get_software_version(self) -> str:
+        if Krita.software_version is None:
+            try:
+                # Prints e.g. "krita 5.2.2"
+                output = subprocess.run(["krita", "--version"], capture_output=True, text=True, timeout=10, check=True).stdout
+                Krita.software_version = output.split()[-1] if output.split() else "unknown"
+            except (OSError, subprocess.SubprocessError):
+                Krita.software_version = "unknown"
+        return Krita.software_version
+
     def start_new_drawing(self, size: Size):
         """
         Software needs to be already open and active. Does not check for it!
@@ -35,11 +60,11 @@ class Krita(SoftwareBase):
 
         pya.hotkey("ctrl", "n")
         try:
-            pya.locateOnScreen(f"{scr_folder}/window_title.png", 5, confidence=0.8) # TODO - Cleanup - Nicer file path
+            locate_on_screen(f"{scr_folder}/window_title.png", 5, confidence=0.8, layout=self.layout) # TODO - Cleanup - Nicer file path
         except:
             print(f"Did not find active new document window title")
             # TODO change back
-            title_pos = pya.locateCenterOnScreen(f"{scr_folder}/window_title_unactive.png", minSearchTime=5, confidence=0.9)
+            title_pos = locate_center_on_screen(f"{scr_folder}/window_title_unactive.png", 5, confidence=0.9, layout=self.layout)
             pya.click(title_pos)
 
         pya.hotkey("alt", "i")
@@ -47,36 +72,90 @@ class Krita(SoftwareBase):
         pya.hotkey("alt", "h")
         pya.write(str(size.height))
         pya.hotkey("alt", "c")
-        pya.locateOnScreen(f"{scr_folder}/document_empty_2k_landscape.png", 5, confidence=0.9)
+        locate_on_screen(f"{scr_folder}/document_empty_2k_landscape.png", 5, confidence=0.9, layout=self.layout)
 
     
     def get_drawing_boundaries(self):
-        return pya.locateOnScreen(f"{self.scr_directories['base']}/empty_2k_paper.png", confidence=0.9)
+        return locate_on_screen(f"{self.scr_directories['base']}/empty_2k_paper.png", confidence=0.9, layout=self.layout)
     
     #
     #   DRAWING
     #
     def draw_square_rectangle_tool(self, square: Square):
-        # TODO - Does not work as thought. If drawn with same parameters as freehand, the square is ~20pixels wider on the drawing
-        self.set_brush_draw_mode_rectangle()
-        pya.moveTo(square.top_left)
-        pya.dragTo(square.bottom_right)
+        self.draw_squares_rectangle_tool([square])
+
+    def draw_squares_rectangle_tool(self, squares: list[Square], correction: Optional[RectangleToolCorrection] = None):
+        """
+        Draws each square with one drag of the rectangle tool, selecting the tool only once.
+        Drawn from the same corners, the rectangle tool square is ~20 pixels wider than the freehand one,
+        so the drags are moved by the correction calibrated for the brush size.
+
+        Raises:
+            RuntimeError: If the rectangle tool is not calibrated for the brush size of a square
+        """
+        correction = correction or self.rectangle_correction
+        drags = [correction.get_drag(square) for square in squares]
+        if None in drags:
+            raise RuntimeError(f"{self.software_name} rectangle tool is not calibrated for brush size {squares[drags.index(None)].brush_size}")
+
+        default_pause = pya.PAUSE
+        pya.PAUSE = Krita.batch_action_pause
+        try:
+            self.set_brush_draw_mode_rectangle()
+            for start, end in drags:
+                with span("stroke", points=2):
+                    pya.moveTo(start)
+                    pya.dragTo(end, duration = Krita.rectangle_drag_duration, button='left')
+        finally:
+            pya.PAUSE = default_pause
     
     def draw_square_freehand(self, square: Square):
         points = [square.top_left, square.top_right, square.bottom_right, square.bottom_left, square.top_left]
         self.draw_continues_lines_freehand(points)
 
-    def draw_line_freehand(self, start: Point, end: Point):
+    def draw_line_freehand(self, start: Point, end: Point, duration: Optional[float] = None):
         self.set_brush_draw_mode_freehand()
         pya.moveTo(start)
-        pya.dragTo(end, duration = Krita.freehand_draw_speed, button='left')
+        if duration is None:
+            duration = self.get_drag_duration(start, end)
+        pya.dragTo(end, duration = duration, button='left')
     
     def draw_continues_lines_freehand(self, points: list[Point]):
         self.set_brush_draw_mode_freehand()
         pya.moveTo(points[0])
-        for point in points[1:]:
-            pya.dragTo(point, duration = Krita.freehand_draw_speed, button='left')
+        for start, end in zip(points, points[1:]):
+            pya.dragTo(end, duration = self.get_drag_duration(start, end), button='left')
+
+    def get_drag_duration(self, start: Point, end: Point) -> float:
+        """Shortest drag duration that draws the segment completely, the calibrated curve if there is one"""
+        if self.drag_speed_curve is None:
+            return Krita.freehand_draw_speed
+        return self.drag_speed_curve.get_duration(distance_between_points(Point(*start), Point(*end)))
+
+    def draw_batch(self, strokes: list[list[Point]]):
+        """
+        Draws all strokes with the freehand brush, selecting the brush only once.
+        Strokes are reordered to keep the pen-up travel between them short.
+        """
+        strokes = order_strokes_for_short_travel(strokes, Point(*pya.position()))
+        if not strokes:
+            return
+
+        default_pause = pya.PAUSE
+        pya.PAUSE = Krita.batch_action_pause
+        try:
+            self.set_brush_draw_mode_freehand()
+            for stroke in strokes:
+                with span("stroke", points=len(stroke)):
+                    pya.moveTo(stroke[0])
+                    for start, end in zip(stroke, stroke[1:]):
+                        pya.dragTo(end, duration = self.get_drag_duration(start, end), button='left')
+        finally:
+            pya.PAUSE = default_pause
     
+    def undo(self):
+        pya.hotkey("ctrl", "z")
+
     def close_application(self, save: bool = False):
         pya.hotkey("ctrl", "q")
         if not save:
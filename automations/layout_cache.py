@@ -0,0 +1,69 @@
+import os
+from typing import Optional, Union
+
+from automations.calibration_store import CalibrationStore, get_machine_key
+from shapes.common import Box
+
+
+class LayoutCache:
+    """Remembers where the UI elements of a software were found, between runs.
+
+    Positions are kept in the calibration file, keyed by the machine, the software and its version and
+    the geometry of the monitor the software is on, because any of them can move the elements. Element is identified by its template file.
+    A remembered element is first searched only around its old position, see matching.locate_on_screen.
+
+    Args:
+        key (str): Screen configuration and software version, see LayoutCache.get_key.
+        padding (int): How far around the remembered position the element is searched.
+        store (CalibrationStore, optional): Defaults to the calibration file of the user.
+
+    Examples:
+        >>> import tempfile
+        >>> store = CalibrationStore(os.path.join(tempfile.mkdtemp(), "calibration.json"))
+        >>> layout = LayoutCache("Krita/5.2/2560x1440", store=store)
+        >>> layout.remember("screenshots/krita/open_empty.png", Box(10, 20, 30, 40))
+        >>> LayoutCache("Krita/5.2/2560x1440", store=store).get("screenshots/krita/open_empty.png")
+        Box(left=10, top=20, width=30, height=40)
+        >>> LayoutCache("Krita/5.3/2560x1440", store=store).get("screenshots/krita/open_empty.png") is None
+        True
+    """
+    # Dry runs find every element at a made up position, and turn the remembering off
+    enabled = True
+
+    def __init__(self, key: str, padding: int = 8, store: Optional[CalibrationStore] = None):
+        self.key = key
+        self.padding = padding
+        self.store = store or CalibrationStore()
+        self.hits = 0
+        self.misses = 0
+        self._elements: dict[str, list[int]] = dict(self.store.get("ui_layout", key, {}))
+
+    @staticmethod
+    def get_key(software_name: str, software_version: str, monitor: Box) -> str:
+        """
+        Examples:
+            >>> LayoutCache.get_key("Krita", "5.2", Box(2560, 0, 1920, 1080)).endswith("/Krita/5.2/1920x1080+2560+0")
+            True
+        """
+        return get_machine_key(software_name, software_version, f"{monitor.width}x{monitor.height}+{monitor.left}+{monitor.top}")
+
+    def get(self, element: Union[str, object]) -> Optional[Box]:
+        """Remembered position of the element, None if it has not been found before"""
+        if not LayoutCache.enabled or not isinstance(element, str):
+            return None
+        box = self._elements.get(_get_element_name(element))
+        return Box(*box) if box else None
+
+    def remember(self, element: Union[str, object], box: Box):
+        if not LayoutCache.enabled or not isinstance(element, str):
+            return
+        name = _get_element_name(element)
+        box = [int(value) for value in box]
+        if self._elements.get(name) == box:
+            return
+        self._elements[name] = box
+        self.store.set("ui_layout", self.key, self._elements)
+
+
+def _get_element_name(image_path: str) -> str:
+    return os.path.normpath(image_path)
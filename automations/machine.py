@@ -1,56 +1,122 @@
-import pyautogui as pya
-from pyscreeze import ImageNotFoundException, Point
-import pywinctl as pwctl # Some pyautogui functions are unavailabel on linux systems
 from PIL.Image import Image
 
-from time import sleep
-from typing import Union
+from typing import Optional, Union
 
+from automations.gui import pyautogui as pya, pyscreeze, pywinctl as pwctl, clock, span
+from automations.input_scheduler import InputScheduler
 from automations.software_base import SoftwareBase
+from automations.layout_cache import LayoutCache
+from shapes.shape import Shape
+from shapes.common import Box
+from shapes.snapshot_store import SnapshotHandle, SnapshotStore, default_snapshot_store
+from automations.matching import ImageNotFoundException, locate_on_screen, locate_all_on_screen, locate_all_in_image, apply_match_profile, get_image_name, count_all_on_screen
 
 class Machine:
-    def __init__(self, screenshots_directory: str) -> None:
+    def __init__(self, screenshots_directory: str, input_scheduler: Optional[InputScheduler] = None) -> None:
+        """
+        If an input scheduler is given, it is installed between the code and pyautogui.
+        It queues the input, drops redundant actions and adapts the pauses between them
+        """
         self.screenshots_directory = screenshots_directory
+        self.input_scheduler = input_scheduler
+        if input_scheduler is not None:
+            input_scheduler.install()
+
+    def stop_input_scheduler(self):
+        """Sends the still queued input and removes the scheduler"""
+        if self.input_scheduler is not None:
+            self.input_scheduler.uninstall()
+            self.input_scheduler = None
     
     def open_software(self, software: SoftwareBase):
         """Opens the given software and verifies it is open"""
+        if self.input_scheduler is not None:
+            self.input_scheduler.idempotent_keys.update(software.idempotent_keys)
+        layout = self.load_layout(software)
         pya.press("win")
-        pya.locateOnScreen(f"{self.screenshots_directory}/window_selector_search_bar.png", 5)
+        locate_on_screen(f"{self.screenshots_directory}/window_selector_search_bar.png", 5, layout=layout)
         pya.write(software.software_name)
 
         try:
-            pya.locateOnScreen(f"{software.scr_directories['base']}/window_selector_selected.png", 5, confidence=0.9)
-        except pya.ImageNotFoundException:
-            pya.locateOnScreen(f"{software.scr_directories['base']}/window_selector_selected_already_open.png", 5, confidence=0.9)
+            locate_on_screen(f"{software.scr_directories['base']}/window_selector_selected.png", 5, confidence=0.9, layout=layout, optional=True)
+        except ImageNotFoundException:
+            locate_on_screen(f"{software.scr_directories['base']}/window_selector_selected_already_open.png", 5, confidence=0.9, layout=layout)
 
         pya.press("enter")
 
         try:
-            pya.locateOnScreen(f"{software.scr_directories['base']}/open_empty.png", 5)
-        except pya.ImageNotFoundException:
+            locate_on_screen(f"{software.scr_directories['base']}/open_empty.png", 5, layout=layout, optional=True)
+        except ImageNotFoundException:
             print("Did not find full screen application. Making it into one!")
             pya.hotkey("win", "up")
-            pya.locateOnScreen(f"{software.scr_directories['base']}/open_empty.png", 10, confidence=0.9)
+            locate_on_screen(f"{software.scr_directories['base']}/open_empty.png", 10, confidence=0.9, layout=layout)
+
+    def load_layout(self, software: SoftwareBase) -> LayoutCache:
+        """Remembered UI element positions for the software on this monitor. The software keeps using it after opening"""
+        if LayoutCache.enabled:
+            key = LayoutCache.get_key(software.software_name, software.get_software_version(), self.get_monitor_geometry())
+        else:
+            # Nothing is remembered in dry runs, so the software version and the monitor are not asked for
+            key = software.software_name
+        software.layout = LayoutCache(key)
+        return software.layout
+
+    def get_monitor_geometry(self) -> Box:
+        """Position and size of the monitor the active window is on. The whole screen if pywinctl does not know it"""
+        window = pwctl.getActiveWindow()
+        if window is not None:
+            screens = pwctl.getAllScreens()
+            for name in window.getDisplay():
+                if name in screens:
+                    position, size = screens[name]["pos"], screens[name]["size"]
+                    return Box(position.x, position.y, size.width, size.height)
+        width, height = pya.size()
+        return Box(0, 0, width, height)
 
     def close_software(self, software: SoftwareBase):
-        software.close_application()
+        with span("close application", software=software.software_name):
+            software.close_application()
 
         # Make sure the application is closed by checking for title name
         # Needs to sleep for a moment before checking. Sometimes "Xlib.error.BadWindow:" occurs if immediately checked
-        sleep(1)
+        clock.sleep(1)
         titles = pwctl.getAllTitles()
         if software.software_name in titles:
             raise RuntimeError(f"{software.software_name} is still runnning")
     
-    def count_all_image_occurances(self, image: Union[str, Image], *args, **kwargs) -> int:
-        locations = pya.locateAllOnScreen(image, *args, **kwargs)
-        counter = 0
-        try:
-            for _ in locations:
-                counter += 1
-        except pya.ImageNotFoundException and ImageNotFoundException:
-            return 0
-        
-        return counter
+    def get_shape_screenshot(self, shape: Shape, store: Optional[SnapshotStore] = None) -> SnapshotHandle:
+        """Same as shape.get_screenshot(), but captures through the machine so dry runs and recorders see it"""
+        if store is None:
+            store = default_snapshot_store
+        with span("shape screenshot", region=shape.get_screenshot_region()):
+            return store.add(pyscreeze.screenshot(region=shape.get_screenshot_region()))
+
+    def count_all_image_occurances(self, image: Union[str, Image, SnapshotHandle], **kwargs) -> int:
+        """
+        Counts the matches of the image on the screen. Calibrated match profile of the image overrides the kwargs.
+        """
+        with span("count", template=get_image_name(image), **kwargs) as details:
+            details["found"] = len(locate_all_on_screen(image, **kwargs))
+            return details["found"]
+
+    def count_all_images_occurances(self, images: list[Union[str, Image, SnapshotHandle]], **kwargs) -> list[int]:
+        """
+        Counts the matches of each image on the screen in one call, like count_all_image_occurances for each of them.
+        Templates of different sizes share one transform of the screen, see count_all_on_screen
+        """
+        return count_all_on_screen(images, **kwargs)
+
+    def is_image_in_shape_area(self, image: Union[str, Image, SnapshotHandle], shape: Shape, **kwargs) -> bool:
+        """
+        Checks if the image is found in the area of the drawn shape. Only the bounding box of the shape
+        is captured and the search stops at the first match, so it is far cheaper than a count of the screen
+        """
+        with span("verify shape", template=get_image_name(image), region=shape.get_bounding_box(), **kwargs) as details:
+            details["found"] = bool(locate_all_on_screen(image, region=shape.get_bounding_box(), limit=1, **kwargs))
+            return details["found"]
+
+    def count_all_image_occurances_in_image(self, image: Union[str, Image, SnapshotHandle], haystack: Union[str, Image], **kwargs) -> int:
+        """Same as count_all_image_occurances, but searches the given haystack image instead of the screen"""
+        return len(locate_all_in_image(image, haystack, **apply_match_profile(image, kwargs)))
 
 
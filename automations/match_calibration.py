@@ -0,0 +1,133 @@
+"""
+Finds the cheapest matching parameters that still give exact counts for each template.
+
+Fixture frames are full screen captures with a JSON sidecar (frame.png -> frame.json):
+    {
+        "counts": {"krita/shapes/square_freehand_40_100_100_black_on_white.png": 4, ...},
+        "roi": [left, top, width, height]   # Optional, the area the template is searched from
+    }
+Template paths in "counts" are relative to the screenshots directory.
+Templates without any fixture counts are not calibrated.
+"""
+
+from PIL import Image as PILImage
+
+import glob
+import itertools
+import json
+import os
+from time import perf_counter
+from typing import Optional
+
+from automations.gui import pyscreeze
+from automations.matching import locate_all_in_image, save_match_profile
+from shapes.common import Box
+
+
+GRAYSCALE_OPTIONS = (False, True)
+CONFIDENCE_OPTIONS = (0.8, 0.9, 0.95, 0.98, 0.99, 0.995)
+DOWNSCALE_OPTIONS = (1, 2, 4)
+ROI_PADDING_OPTIONS = (0, 16, 64)
+BINARY_OPTIONS = (False, True)
+PREFILTER_OPTIONS = (False, True)
+
+
+def record_fixture_frame(fixtures_directory: str, name: str, counts: dict[str, int], roi: Optional[Box] = None) -> str:
+    """Captures the screen as a fixture frame with the known template counts"""
+    os.makedirs(fixtures_directory, exist_ok=True)
+    path = os.path.join(fixtures_directory, f"{name}.png")
+    pyscreeze.screenshot().save(path)
+    sidecar = {"counts": counts}
+    if roi is not None:
+        sidecar["roi"] = [int(value) for value in roi]
+    with open(os.path.join(fixtures_directory, f"{name}.json"), "w") as sidecar_file:
+        json.dump(sidecar, sidecar_file, indent=4)
+    return path
+
+
+def load_fixture_frames(fixtures_directory: str) -> list[tuple[PILImage.Image, dict]]:
+    fixtures = []
+    for sidecar_path in sorted(glob.glob(os.path.join(fixtures_directory, "*.json"))):
+        frame_path = f"{os.path.splitext(sidecar_path)[0]}.png"
+        if not os.path.exists(frame_path):
+            continue
+        with open(sidecar_path) as sidecar_file:
+            sidecar = json.load(sidecar_file)
+        fixtures.append((PILImage.open(frame_path).convert("RGB"), sidecar))
+    return fixtures
+
+
+def calibrate_template(template_path: str, frames: list[tuple[PILImage.Image, int, Optional[Box]]]) -> Optional[dict]:
+    """
+    Tries every parameter combination against the frames and returns the fastest one
+    that counts the template exactly right in every frame.
+
+    Args:
+        template_path (str): Template image to calibrate
+        frames (list): (frame, expected count, roi or None) for each fixture frame
+
+    Returns:
+        dict: The profile with the measured time, or None if no combination was exact
+    """
+    template = PILImage.open(template_path).convert("RGB")
+    has_roi = any(roi is not None for _, _, roi in frames)
+    paddings = ROI_PADDING_OPTIONS if has_roi else (0,)
+
+    best = None
+    for grayscale, confidence, downscale, roi_padding, binary, prefilter in itertools.product(
+            GRAYSCALE_OPTIONS, CONFIDENCE_OPTIONS, DOWNSCALE_OPTIONS, paddings, BINARY_OPTIONS, PREFILTER_OPTIONS):
+        elapsed = 0.0
+        exact = True
+        for frame, expected, roi in frames:
+            start = perf_counter()
+            found = len(locate_all_in_image(
+                template, frame, region=roi, grayscale=grayscale,
+                confidence=confidence, downscale=downscale, roi_padding=roi_padding, binary=binary, prefilter=prefilter
+            ))
+            elapsed += perf_counter() - start
+            if found != expected:
+                exact = False
+                break
+        if not exact:
+            continue
+
+        # Faster wins, on a tie the stricter confidence is kept
+        if best is None or elapsed < best["seconds"] or (elapsed == best["seconds"] and confidence > best["confidence"]):
+            best = {
+                "grayscale": grayscale,
+                "confidence": confidence,
+                "downscale": downscale,
+                "roi_padding": roi_padding,
+                "binary": binary,
+                "prefilter": prefilter,
+                "seconds": elapsed,
+                "frames": len(frames)
+            }
+    return best
+
+
+def calibrate_screenshots_directory(screenshots_directory: str, fixtures_directory: str) -> dict[str, Optional[dict]]:
+    """
+    Calibrates every template that has fixture counts and writes its profile next to the template.
+    The profiles are loaded automatically by the locate and count functions in automations.matching
+
+    Returns:
+        dict: Template path -> written profile, or None if no exact settings were found
+    """
+    fixtures = load_fixture_frames(fixtures_directory)
+    results = {}
+    for template_path in sorted(glob.glob(os.path.join(screenshots_directory, "**", "*.png"), recursive=True)):
+        relative_path = os.path.relpath(template_path, screenshots_directory).replace(os.sep, "/")
+        frames = [
+            (frame, sidecar["counts"][relative_path], Box(*sidecar["roi"]) if "roi" in sidecar else None)
+            for frame, sidecar in fixtures
+            if relative_path in sidecar.get("counts", {})
+        ]
+        if not frames:
+            continue
+
+        profile = calibrate_template(template_path, frames)
+        if profile is not None:
+            save_match_profile(template_path, profile)
+        results[template_path] = profile
+    return results
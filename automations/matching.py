@@ -0,0 +1,360 @@
+from PIL import Image as PILImage
+from PIL.Image import Image
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from time import time
+from typing import Optional, Union
+
+from automations.gui import pyautogui, pyscreeze, notify, span
+from automations.layout_cache import LayoutCache
+from automations.tiled_matching import TiledMatcher
+from automations.binary_matching import BinaryMatcher
+from automations.ink_prefilter import InkCountPrefilter
+from automations.fft_matching import FFTMatcher
+from shapes.common import Box, Point
+from shapes.snapshot_store import SnapshotHandle
+
+class ImageNotFoundException(Exception):
+    """Raised when an image is not found on the screen in time"""
+
+
+# Parameters a match profile can set. Calibrated with automations.match_calibration
+PROFILE_KEYS = ("grayscale", "confidence", "downscale", "roi_padding", "binary", "prefilter")
+
+
+def get_match_profile_path(image_path: str) -> str:
+    """Profile is stored next to the template: button.png -> button.profile.json"""
+    return f"{os.path.splitext(image_path)[0]}.profile.json"
+
+
+def load_match_profile(image: Union[str, Image]) -> dict:
+    """Returns the calibrated matching parameters of the template, or an empty dict if there is none"""
+    if not isinstance(image, str):
+        return {}
+    try:
+        with open(get_match_profile_path(image)) as profile_file:
+            profile = json.load(profile_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {key: profile[key] for key in PROFILE_KEYS if key in profile}
+
+
+def save_match_profile(image_path: str, profile: dict):
+    with open(get_match_profile_path(image_path), "w") as profile_file:
+        json.dump(profile, profile_file, indent=4)
+
+
+def apply_match_profile(image: Union[str, Image, SnapshotHandle], kwargs: dict) -> dict:
+    """
+    Calibrated profile values replace the guessed ones given at the call site.
+    Binary matching can miss anti-aliased matches, so it is used only when the call site allows it
+    with binary=True and the calibrated profile found it exact for the template
+    """
+    profile = load_match_profile(image)
+    applied = {**kwargs, **profile}
+    if "binary" in applied:
+        applied["binary"] = bool(kwargs.get("binary") and profile.get("binary"))
+    return applied
+
+
+def pad_region(region: Optional[Box], padding: int, haystack_size: tuple[int, int]) -> Optional[Box]:
+    """Grows the region by padding on every side, clipped to the haystack
+
+    Examples:
+        >>> pad_region(Box(10, 10, 20, 20), 5, (100, 100))
+        Box(left=5, top=5, width=30, height=30)
+        >>> pad_region(Box(0, 90, 20, 10), 5, (100, 100))
+        Box(left=0, top=85, width=25, height=15)
+        >>> pad_region(None, 5, (100, 100)) is None
+        True
+    """
+    if region is None:
+        return None
+    left = max(0, region[0] - padding)
+    top = max(0, region[1] - padding)
+    right = min(haystack_size[0], region[0] + region[2] + padding)
+    bottom = min(haystack_size[1], region[1] + region[3] + padding)
+    return Box(left, top, right - left, bottom - top)
+
+
+class MatchCache:
+    """Remembers match results by what was matched, so an unchanged screen is not searched again.
+
+    The key is a fingerprint of the searched pixels, the identity of the template and the matching
+    parameters. Anything drawn in the searched region changes the fingerprint, so stale results
+    are never returned. Least recently used results are dropped when max_entries is reached.
+
+    Examples:
+        >>> cache = MatchCache(max_entries=2)
+        >>> frame = PILImage.new("RGB", (4, 4), (255, 255, 255))
+        >>> template = PILImage.new("RGB", (2, 2))
+        >>> key = cache.get_key(template, frame, confidence=0.9)
+        >>> cache.get(key) is None
+        True
+        >>> cache.put(key, [Box(0, 0, 1, 1)])
+        >>> cache.get(cache.get_key(template, frame.copy(), confidence=0.9))
+        [Box(left=0, top=0, width=1, height=1)]
+        >>> cache.get(cache.get_key(template, frame, confidence=0.8)) is None
+        True
+        >>> cache.hits, cache.misses
+        (1, 2)
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        # Dry runs answer the matches from a model instead of the pixels, and turn the cache off
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict[tuple, tuple[Box, ...]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get_key(self, image: Union[str, Image, SnapshotHandle], haystack: Image, **parameters) -> tuple:
+        return (get_frame_fingerprint(haystack), get_template_id(image), tuple(sorted(parameters.items())))
+
+    def get(self, key: tuple) -> Optional[list[Box]]:
+        if not self.enabled:
+            return None
+        boxes = self._results.get(key)
+        if boxes is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._results.move_to_end(key)
+        return list(boxes)
+
+    def put(self, key: tuple, boxes: list[Box]):
+        if not self.enabled:
+            return
+        self._results[key] = tuple(boxes)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+
+def get_frame_fingerprint(frame: Image) -> str:
+    """Hash of the pixels, identical frames have identical fingerprints"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{frame.mode}{frame.size}".encode())
+    digest.update(frame.tobytes())
+    return digest.hexdigest()
+
+
+def get_template_id(image: Union[str, Image, SnapshotHandle]) -> tuple:
+    """Template files are identified by path and modification time, so an edited file is not mixed up with the old one"""
+    if isinstance(image, str):
+        stat = os.stat(image)
+        return ("file", os.path.abspath(image), stat.st_mtime_ns, stat.st_size)
+    if isinstance(image, SnapshotHandle):
+        # Snapshot keys are already hashes of the content
+        return ("snapshot", image.key)
+    return ("image", get_frame_fingerprint(image))
+
+
+# Cache used for the screen searches unless another one is given
+default_match_cache = MatchCache()
+
+
+# Matches large frames in tiles on several threads. Sits right on top of pyscreeze, under everything pushed later
+default_tiled_matcher = TiledMatcher()
+pyscreeze.push_override(default_tiled_matcher)
+# Skips the windows with the wrong amount of ink when prefilter=True is given
+default_ink_prefilter = InkCountPrefilter()
+pyscreeze.push_override(default_ink_prefilter)
+# Matches ink masks when binary=True is given, see locate_all_in_image
+default_binary_matcher = BinaryMatcher()
+pyscreeze.push_override(default_binary_matcher)
+# Counts several templates from one frame transform, see count_all_on_screen
+default_fft_matcher = FFTMatcher()
+pyscreeze.push_override(default_fft_matcher)
+
+
+def get_image_name(image: Union[str, Image, SnapshotHandle]) -> str:
+    """Template name for the logs and traces: the path of a file, the type of anything else"""
+    return image if isinstance(image, str) else type(image).__name__
+
+
+def _load_image(image: Union[str, Image, SnapshotHandle]) -> Image:
+    if isinstance(image, str):
+        return PILImage.open(image)
+    if isinstance(image, SnapshotHandle):
+        return image.to_image()
+    return image
+
+
+def locate_all_in_image(
+        image: Union[str, Image, SnapshotHandle],
+        haystack: Union[str, Image],
+        region: Optional[Box] = None,
+        grayscale: bool = False,
+        confidence: float = 0.999,
+        downscale: int = 1,
+        roi_padding: int = 0,
+        limit: int = 10000,
+        cache: Optional[MatchCache] = None,
+        binary: bool = False,
+        prefilter: bool = False
+        ) -> list[Box]:
+    """
+    Finds all positions where the image matches the haystack with at least the given confidence.
+    Same semantics as pyscreeze.locateAll, but returns an empty list instead of raising when nothing is found.
+
+    Args:
+        downscale (int): Both images are shrunk by this factor before matching. Positions are scaled back
+        roi_padding (int): Region is grown by this much on every side before searching
+        cache (MatchCache, optional): Returns the earlier result if the same pixels were already searched the same way
+        binary (bool): Black strokes on white paper are matched as 1-bit ink masks first, see BinaryMatcher
+        prefilter (bool): Windows with too much or too little ink are not correlated, see InkCountPrefilter
+    """
+    haystack = _load_image(haystack)
+    region = pad_region(region, roi_padding, haystack.size)
+    if region is not None:
+        haystack = haystack.crop((region[0], region[1], region[0] + region[2], region[1] + region[3]))
+
+    with span("match", template=get_image_name(image), confidence=confidence, grayscale=grayscale,
+              downscale=downscale, binary=binary, prefilter=prefilter, searched_size=haystack.size) as details:
+        cache_key = None
+        if cache is not None and cache.enabled:
+            cache_key = cache.get_key(image, haystack, region=region, grayscale=grayscale, confidence=confidence, downscale=downscale, limit=limit, binary=binary, prefilter=prefilter)
+            if (boxes := cache.get(cache_key)) is not None:
+                details.update(found=len(boxes), cached=True)
+                return boxes
+
+        boxes = _locate_all_in_region(_load_image(image), haystack, region, grayscale, confidence, downscale, limit, binary, prefilter)
+        if cache_key is not None:
+            cache.put(cache_key, boxes)
+        details.update(found=len(boxes), cached=False)
+        return boxes
+
+
+def _locate_all_in_region(needle: Image, haystack: Image, region: Optional[Box], grayscale: bool, confidence: float, downscale: int, limit: int, binary: bool = False, prefilter: bool = False) -> list[Box]:
+    """Matches the needle in the haystack already cropped to the region, positions are returned in the full haystack"""
+    if downscale > 1:
+        needle_size = needle.size
+        needle = needle.resize((max(1, needle.width // downscale), max(1, needle.height // downscale)), PILImage.BOX)
+        haystack = haystack.resize((max(1, haystack.width // downscale), max(1, haystack.height // downscale)), PILImage.BOX)
+    if needle.width > haystack.width or needle.height > haystack.height:
+        return []
+
+    # Only given when set, the plain pyscreeze does not know them
+    matcher_kwargs = {key: True for key, value in (("binary", binary), ("prefilter", prefilter)) if value}
+    try:
+        boxes = list(pyscreeze.locateAll(needle, haystack, grayscale=grayscale, confidence=confidence, limit=limit, **matcher_kwargs))
+    except pyscreeze.ImageNotFoundException:
+        return []
+
+    offset_left, offset_top = (region[0], region[1]) if region is not None else (0, 0)
+    if downscale > 1:
+        return [
+            Box(int(box.left) * downscale + offset_left, int(box.top) * downscale + offset_top, needle_size[0], needle_size[1])
+            for box in boxes
+        ]
+    return [Box(int(box.left) + offset_left, int(box.top) + offset_top, box.width, box.height) for box in boxes]
+
+
+def locate_all_on_screen(image: Union[str, Image, SnapshotHandle], use_profile: bool = True, **kwargs) -> list[Box]:
+    """
+    Results are cached by the captured pixels, so searching an unchanged screen again returns at once.
+    With a region only the region, grown by roi_padding, is captured from the screen.
+    """
+    if use_profile:
+        kwargs = apply_match_profile(image, kwargs)
+    kwargs.setdefault("cache", default_match_cache)
+    region = kwargs.pop("region", None)
+    if region is None:
+        return locate_all_in_image(image, pyscreeze.screenshot(), **kwargs)
+
+    region = pad_region(region, kwargs.pop("roi_padding", 0), pyautogui.size())
+    boxes = locate_all_in_image(image, pyscreeze.screenshot(region=tuple(region)), **kwargs)
+    return [Box(box.left + region.left, box.top + region.top, box.width, box.height) for box in boxes]
+
+
+def count_all_on_screen(images: list[Union[str, Image, SnapshotHandle]], confidence: Union[float, list[float]] = 0.999, grayscale: bool = False, region: Optional[Box] = None) -> list[int]:
+    """
+    Counts the matches of each image in one capture of the screen, in the order of the images.
+    The capture is transformed once and shared by all the images, see FFTMatcher.
+    Confidence can be given for each image separately. Match profiles are not applied, all images are matched the same way
+    """
+    haystack = pyscreeze.screenshot(region=tuple(region)) if region is not None else pyscreeze.screenshot()
+    with span("count all", templates=[get_image_name(image) for image in images], confidence=confidence, grayscale=grayscale) as details:
+        details["found"] = list(pyscreeze.countAll([_load_image(image) for image in images], haystack, grayscale=grayscale, confidence=confidence))
+        return details["found"]
+
+
+def locate_on_screen(
+        image: Union[str, Image, SnapshotHandle],
+        min_search_time: float = 0,
+        use_profile: bool = True,
+        layout: Optional[LayoutCache] = None,
+        optional: bool = False,
+        **kwargs
+        ) -> Box:
+    """
+    Keeps searching the screen for the image until it is found or min_search_time runs out.
+    Works like pyautogui.locateOnScreen, but uses the calibrated match profile of the image.
+
+    With a layout cache, an element found before is searched first around its remembered position.
+    If it is not there on the first poll, the polls alternate between its remembered position and the
+    whole screen, so an element that moved costs one more capture instead of the whole search time.
+    A position found on the whole screen is remembered.
+
+    Give optional=True when the image may rightly be missing, like the first of two alternative dialogs.
+    Its miss is then not taken as the UI lagging behind the input, see InputScheduler.
+
+    Raises:
+        ImageNotFoundException: If the image was not found in time
+    """
+    if layout is None:
+        return _poll_screen(image, min_search_time, use_profile, [{}], optional, **kwargs)[0]
+
+    remembered = layout.get(image)
+    if remembered is None:
+        box = _poll_screen(image, min_search_time, use_profile, [{}], optional, **kwargs)[0]
+        layout.remember(image, box)
+        return box
+
+    try:
+        box, search = _poll_screen(image, min_search_time, use_profile, [{"region": remembered, "roi_padding": layout.padding}, {}], optional, **kwargs)
+    except ImageNotFoundException:
+        layout.misses += 1
+        raise
+    if search == 0:
+        layout.hits += 1
+    else:
+        layout.misses += 1
+        layout.remember(image, box)
+    return box
+
+
+def _poll_screen(image: Union[str, Image, SnapshotHandle], min_search_time: float, use_profile: bool, searches: list[dict], optional: bool = False, **kwargs) -> tuple[Box, int]:
+    """Polls with the search arguments in turn. Returns the found box and which of the searches found it"""
+    image_name = get_image_name(image)
+    notify("wait", image=image_name, timeout=min_search_time)
+    end_time = time() + min_search_time
+    polls = 0
+    while True:
+        search = polls % len(searches)
+        with span("poll", image=image_name, poll=polls + 1):
+            boxes = locate_all_on_screen(image, use_profile, limit=1, **searches[search], **kwargs)
+        polls += 1
+        if boxes:
+            # Found on the first poll means the UI had already reacted to the previous actions
+            notify("wait_result", image=image_name, found=True, polls=polls, optional=optional)
+            return boxes[0], search
+        # Every search is made at least once, even without search time
+        if time() > end_time and polls >= len(searches):
+            notify("wait_result", image=image_name, found=False, polls=polls, optional=optional)
+            raise ImageNotFoundException(f"Could not locate the image {image}")
+
+
+def locate_center_on_screen(image: Union[str, Image, SnapshotHandle], min_search_time: float = 0, **kwargs) -> Point:
+    """Center of locate_on_screen, takes the same arguments"""
+    box = locate_on_screen(image, min_search_time, **kwargs)
+    return Point(box.left + box.width // 2, box.top + box.height // 2)
@@ -0,0 +1,287 @@
+from PIL import Image as PILImage, ImageDraw
+from PIL.Image import Image
+
+import json
+import os
+import random
+import zipfile
+from io import BytesIO
+from time import perf_counter
+from typing import Optional
+
+from automations.software_base import SoftwareBase
+from automations.painter import create_painting_border_for_brush
+from shapes.square import Square, create_squares
+from shapes.common import Point, Box, Size, order_strokes_for_short_travel
+
+class OfflineDocument(SoftwareBase):
+    """
+    Drawing "software" that renders straight into an image instead of moving the mouse.
+    Uses the same brush semantics as the freehand brush: round brush with diameter of brush_size.
+    The document has a white background layer and a transparent strokes layer,
+    and can be saved as a flattened PNG or a layered OpenRaster (.ora) file.
+
+    The rectangle tool draws a rectangle between the corners of the drag, with its edges moved by the
+    (left, top, right, bottom) offsets of the brush size, like the offset of Krita's rectangle tool.
+    """
+    background_color = (255, 255, 255, 255)
+    stroke_color = (0, 0, 0, 255)
+
+    def __init__(self, brush_size: int = 40, rectangle_tool_offsets: Optional[dict[int, tuple[int, int, int, int]]] = None) -> None:
+        self.scr_directories = {}
+        self.software_name = "Offline"
+        self.brush_size = brush_size
+        self.rectangle_tool_offsets = rectangle_tool_offsets or {}
+        self.size: Optional[Size] = None
+        self.strokes_layer: Optional[Image] = None
+        self._history: list[Image] = []
+
+    #
+    #   BASICS
+    #
+    def start_new_drawing(self, size: Size):
+        self.size = size
+        self.strokes_layer = PILImage.new("RGBA", (size.width, size.height), (0, 0, 0, 0))
+        self._draw = ImageDraw.Draw(self.strokes_layer)
+        self._history = []
+
+    def get_drawing_boundaries(self) -> Box:
+        return Box(0, 0, self.size.width, self.size.height)
+
+    def checkpoint(self):
+        """Saves the current strokes, the next undo returns to them"""
+        self._history.append(self.strokes_layer.copy())
+
+    def undo(self):
+        if not self._history:
+            return
+        self.strokes_layer = self._history.pop()
+        self._draw = ImageDraw.Draw(self.strokes_layer)
+
+    def close_application(self, save: bool = False):
+        self.strokes_layer = None
+        self._draw = None
+
+    #
+    #   DRAWING
+    #
+    def draw_square_freehand(self, square):
+        self.draw_continues_lines_freehand(square.get_points_for_continuous_drawing())
+
+    def draw_squares_rectangle_tool(self, squares: list[Square], correction=None):
+        """Without a correction the drags go from corner to corner of the squares"""
+        for square in squares:
+            drag = correction.get_drag(square) if correction is not None else None
+            start, end = drag or (square.top_left, square.bottom_right)
+            left, top, right, bottom = self.rectangle_tool_offsets.get(self.brush_size, (0, 0, 0, 0))
+            start, end = Point(start.x + left, start.y + top), Point(end.x + right, end.y + bottom)
+            self.draw_continues_lines_freehand([start, Point(end.x, start.y), end, Point(start.x, end.y), start])
+
+    def draw_line_freehand(self, start: Point, end: Point, duration: Optional[float] = None):
+        # Rendering does not depend on the drag speed
+        self.draw_continues_lines_freehand([start, end])
+
+    def draw_continues_lines_freehand(self, points: list[Point]):
+        radius = self.brush_size // 2
+        for start, end in zip(points, points[1:]):
+            self._draw.line([tuple(start), tuple(end)], fill=OfflineDocument.stroke_color, width=self.brush_size)
+        # Round brush leaves round caps on every point of the stroke
+        for point in points:
+            self._draw.ellipse(
+                [point[0] - radius, point[1] - radius, point[0] + radius, point[1] + radius],
+                fill=OfflineDocument.stroke_color
+            )
+
+    def draw_batch(self, strokes: list[list[Point]]):
+        # Order does not affect the result. Ordered the same way as on screen, but from the first stroke instead of the pointer position
+        for stroke in order_strokes_for_short_travel(strokes):
+            self.draw_continues_lines_freehand(stroke)
+
+    #
+    #   DRAWING MODES
+    #
+    def set_brush_draw_mode_freehand(self):
+        pass
+
+    def set_brush_draw_mode_rectangle(self):
+        pass
+
+    #
+    #   BRUSH
+    #
+    def get_brush_size(self) -> int:
+        return self.brush_size
+
+    def brush_size_increase(self):
+        self.brush_size += 1
+
+    def brush_size_decrease(self):
+        self.brush_size = max(1, self.brush_size - 1)
+
+    #
+    #   OUTPUT
+    #
+    def get_background_layer(self) -> Image:
+        return PILImage.new("RGBA", (self.size.width, self.size.height), OfflineDocument.background_color)
+
+    def get_merged_image(self) -> Image:
+        """Returns the document flattened into a RGB image, like it is seen on the screen"""
+        return PILImage.alpha_composite(self.get_background_layer(), self.strokes_layer).convert("RGB")
+
+    def save_png(self, path: str):
+        self.get_merged_image().save(path)
+
+    def save_ora(self, path: str):
+        """Saves the document as OpenRaster file with the background and strokes as separate layers"""
+        stack = (
+            "<?xml version='1.0' encoding='UTF-8'?>\n"
+            f'<image version="0.0.1" w="{self.size.width}" h="{self.size.height}">'
+            "<stack>"
+            '<layer name="strokes" src="data/strokes.png" x="0" y="0" opacity="1.0" visibility="visible" />'
+            '<layer name="background" src="data/background.png" x="0" y="0" opacity="1.0" visibility="visible" />'
+            "</stack></image>\n"
+        )
+        merged = self.get_merged_image()
+        thumbnail = merged.copy()
+        thumbnail.thumbnail((256, 256))
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as ora:
+            # Mimetype has to be the first file and uncompressed
+            ora.writestr("mimetype", "image/openraster", compress_type=zipfile.ZIP_STORED)
+            ora.writestr("stack.xml", stack)
+            ora.writestr("data/strokes.png", _png_bytes(self.strokes_layer))
+            ora.writestr("data/background.png", _png_bytes(self.get_background_layer()))
+            ora.writestr("mergedimage.png", _png_bytes(merged))
+            ora.writestr("Thumbnails/thumbnail.png", _png_bytes(thumbnail))
+
+
+def _png_bytes(image: Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_square_template(square_size: Size, brush_size: int) -> Image:
+    """
+    Renders a single square and crops the same area Square.get_screenshot() captures.
+    Can be used as the counting template for the rendered scenes
+    """
+    document = OfflineDocument(brush_size)
+    margin = brush_size * 2
+    document.start_new_drawing(Size(square_size.width + margin * 2, square_size.height + margin * 2))
+    square = Square(Point(margin, margin), square_size, brush_size)
+    document.draw_square_freehand(square)
+    shape_box = (square.get_left_edge(), square.get_top_edge(), square.size.width, square.size.height)
+    return document.get_merged_image().crop(
+        (shape_box[0], shape_box[1], shape_box[0] + shape_box[2], shape_box[1] + shape_box[3])
+    )
+
+
+def render_scenes(
+        output_directory: str,
+        scene_count: int,
+        canvas_size: Size = Size(2560, 1440),
+        square_size: Size = Size(100, 100),
+        square_min_max: tuple[int, int] = (2, 5),
+        brush_size: int = 40,
+        file_format: str = "png",
+        seed: Optional[int] = None
+        ) -> list[str]:
+    """
+    Renders scene_count scenes of randomly placed squares into output_directory.
+    Each scene gets a JSON sidecar with the ground truth square positions.
+
+    Returns:
+        list[str]: Paths of the rendered scene files
+    """
+    if file_format not in ("png", "ora"):
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+    os.makedirs(output_directory, exist_ok=True)
+    rng_state = random.getstate()
+    if seed is not None:
+        random.seed(seed)
+
+    document = OfflineDocument(brush_size)
+    paths = []
+    try:
+        for index in range(scene_count):
+            document.start_new_drawing(canvas_size)
+            # Same placement rules as with the real software, see Painter.get_painting_borders
+            draw_area = create_painting_border_for_brush(document.get_drawing_boundaries(), brush_size)
+            squares = create_squares(random.randint(*square_min_max), draw_area, square_size, brush_size)
+            document.draw_batch([square.get_points_for_continuous_drawing() for square in squares])
+
+            path = os.path.join(output_directory, f"scene_{index:05d}.{file_format}")
+            if file_format == "png":
+                document.save_png(path)
+            else:
+                document.save_ora(path)
+
+            ground_truth = {
+                "canvas": list(canvas_size),
+                "brush_size": brush_size,
+                "squares": [
+                    {
+                        "top_left": [int(square.top_left.x), int(square.top_left.y)],
+                        "size": list(square.size),
+                        "box": [
+                            int(square.get_left_edge()), int(square.get_top_edge()),
+                            int(square.get_right_edge() - square.get_left_edge()),
+                            int(square.get_bottom_edge() - square.get_top_edge())
+                        ]
+                    }
+                    for square in squares
+                ]
+            }
+            with open(f"{os.path.splitext(path)[0]}.json", "w") as sidecar:
+                json.dump(ground_truth, sidecar)
+            paths.append(path)
+    finally:
+        if seed is not None:
+            random.setstate(rng_state)
+
+    return paths
+
+
+def load_scene_image(path: str) -> Image:
+    """Loads a rendered scene as RGB image. OpenRaster files use their merged image"""
+    if path.endswith(".ora"):
+        with zipfile.ZipFile(path) as ora:
+            return PILImage.open(BytesIO(ora.read("mergedimage.png"))).convert("RGB")
+    return PILImage.open(path).convert("RGB")
+
+
+def load_scene_ground_truth(path: str) -> dict:
+    with open(f"{os.path.splitext(path)[0]}.json") as sidecar:
+        return json.load(sidecar)
+
+
+def benchmark_counting(machine, scene_paths: list[str], template, **kwargs) -> dict:
+    """
+    Counts the template in every rendered scene with the machine and compares the counts to the ground truth.
+    Only the counting is timed, loading the scenes is not.
+
+    Returns:
+        dict: scene count, exactly counted scenes, accuracy and the counting time in seconds
+    """
+    exact = 0
+    elapsed = 0.0
+    for path in scene_paths:
+        scene = load_scene_image(path)
+        expected = len(load_scene_ground_truth(path)["squares"])
+
+        start = perf_counter()
+        found = machine.count_all_image_occurances_in_image(template, scene, **kwargs)
+        elapsed += perf_counter() - start
+
+        if found == expected:
+            exact += 1
+
+    return {
+        "scenes": len(scene_paths),
+        "exact": exact,
+        "accuracy": exact / len(scene_paths) if scene_paths else 0.0,
+        "seconds": elapsed,
+        "seconds_per_scene": elapsed / len(scene_paths) if scene_paths else 0.0
+    }
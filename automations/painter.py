@@ -1,14 +1,15 @@
-from pyscreeze import Box, Point
 from PIL.Image import Image
 
 from typing import Optional, Union
 from time import time
 
+from automations.gui import span
 from automations.software_base import SoftwareBase
 from automations.machine import Machine
 from shapes.square import create_squares
-from shapes.common import Size, create_random_point_within_boundaries
+from shapes.common import Point, Box, Size, create_random_point_within_boundaries
 from shapes.shape import Shape
+from shapes.coverage import StrokeCoverageEstimator
 
 class Painter:
     def __init__(self, machine: Machine, software: SoftwareBase) -> None:
@@ -33,38 +34,152 @@ class Painter:
     def close_used_software(self):
         self.machine.close_software(self.software)
     
-    def draw_shapes_on_canvas(self, shapes: list[Shape]):
-        for shape in shapes:
-            self.software.draw_continues_lines_freehand(shape.get_points_for_continuous_drawing())
+    def draw_shapes_on_canvas(self, shapes: list[Shape], template: Optional[Union[str, Image]] = None, max_redraws: int = 2, rectangle_tool: bool = False, **kwargs):
+        """
+        Draws the shapes as one batch. With rectangle_tool the squares are drawn with one drag each
+        instead of four freehand drags, the tool has to be calibrated for the brush size.
+
+        If the template of a drawn shape is given, every shape is checked right after it is drawn.
+        Only the area of the shape is searched for the template, and a shape that is not found is
+        redrawn at once, up to max_redraws times. The kwargs are passed to the matching.
+        The shapes are then known to be on the canvas without counting them from the whole screen.
+
+        Raises:
+            RuntimeError: If a shape is still not found after the redraws
+        """
+        with span("draw shapes", shapes=len(shapes)):
+            if template is None:
+                self.draw_shapes(shapes, rectangle_tool)
+                return
+            for shape in shapes:
+                self.draw_verified_shape(shape, template, max_redraws, rectangle_tool, **kwargs)
+
+    def draw_shapes(self, shapes: list[Shape], rectangle_tool: bool = False):
+        if rectangle_tool:
+            self.software.draw_squares_rectangle_tool(shapes)
+        else:
+            self.software.draw_batch([shape.get_points_for_continuous_drawing() for shape in shapes])
+
+    def draw_verified_shape(self, shape: Shape, template: Union[str, Image], max_redraws: int = 2, rectangle_tool: bool = False, **kwargs):
+        """
+        Draws the shape and checks its area for the template, redrawing it until it is found
+
+        Examples:
+            The first stroke is not found, the shape is drawn once more and then found:
+                >>> from shapes.square import Square
+                >>> class VerifyingMachine:
+                ...     def __init__(self, results): self.results = results
+                ...     def is_image_in_shape_area(self, image, shape, **kwargs): return self.results.pop(0)
+                >>> class Canvas:
+                ...     batches = 0
+                ...     def draw_batch(self, lines): self.batches += 1
+                >>> square = Square(Point(0, 0), Size(100, 100), 10)
+                >>> machine, canvas = VerifyingMachine([False, True]), Canvas()
+                >>> Painter(machine, canvas).draw_verified_shape(square, "square.png", confidence=0.98)  # doctest: +ELLIPSIS
+                Shape ... not found after drawing, redrawing it (1/2)
+                >>> canvas.batches, machine.results
+                (2, [])
+
+            A shape never found stops the drawing after the redraws:
+                >>> machine, canvas = VerifyingMachine([False] * 3), Canvas()
+                >>> Painter(machine, canvas).draw_verified_shape(square, "square.png", confidence=0.98)  # doctest: +ELLIPSIS
+                Traceback (most recent call last):
+                ...
+                RuntimeError: Shape ... not found after 2 redraws
+                >>> canvas.batches
+                3
+        """
+        for redraw in range(max_redraws + 1):
+            if redraw:
+                print(f"Shape {shape} not found after drawing, redrawing it ({redraw}/{max_redraws})")
+            self.draw_shapes([shape], rectangle_tool)
+            if self.machine.is_image_in_shape_area(template, shape, **kwargs):
+                return
+        raise RuntimeError(f"Shape {shape} not found after {max_redraws} redraws")
     
     def draw_line_on_canvas(self, start_point: Point, end_point: Point):
         self.software.draw_line_freehand(start_point, end_point)
 
-    def draw_random_lines_on_canvas_until_image_not_found(self, boundaries: Box, image: Union[str, Image], timeout: int = 240, **kwargs):
-        if (images_found := self.machine.count_all_image_occurances(image, **kwargs)) <= 0:
+    def draw_random_lines_on_canvas_until_image_not_found(self, boundaries: Box, image: Union[str, Image], timeout: int = 240, lines_per_check: int = 1, shapes: Optional[list[Shape]] = None, images_found: Optional[int] = None, max_batches_between_checks: int = 20, **kwargs):
+        """
+        Draws random lines over the boundaries until the image can not be found on the screen anymore.
+        lines_per_check lines are drawn as one batch between the checks
+
+        If the drawn shapes are given, the screen is not checked after every batch. A stroke coverage
+        estimator predicts when every shape is broken, and only then the screen is checked.
+        A failed check calibrates the estimator and the drawing continues. The screen is checked anyway
+        after max_batches_between_checks batches, so a wrong prediction can not keep the loop from ending.
+
+        If the number of images on the screen is already known, give it as images_found to skip the first count.
+
+        Examples:
+            Both squares survive the first checks, the drawing still goes on until they are gone:
+                >>> from shapes.square import Square
+                >>> class CountingMachine:
+                ...     def __init__(self, counts): self.counts = counts
+                ...     def count_all_image_occurances(self, image, **kwargs): return self.counts.pop(0)
+                >>> class Canvas:
+                ...     def get_brush_size(self): return 10
+                ...     def draw_batch(self, lines): pass
+                >>> squares = [Square(Point(x, 0), Size(100, 100), 10) for x in (0, 200)]
+                >>> machine = CountingMachine([2] * 8 + [1, 0])
+                >>> painter = Painter(machine, Canvas())
+                >>> painter.draw_random_lines_on_canvas_until_image_not_found(Box(0, 0, 300, 100), "square.png", timeout=10, shapes=squares, confidence=0.98)  # doctest: +ELLIPSIS
+                One image skrippled over, 1 left
+                No images found any more. Took ... lines, 9 screen checks and ... seconds
+                >>> machine.counts
+                []
+        """
+        if images_found is None:
+            images_found = self.machine.count_all_image_occurances(image, **kwargs)
+        if images_found <= 0:
             return
-        
+
+        estimator = None
+        if shapes:
+            estimator = StrokeCoverageEstimator(shapes, confidence=kwargs.get("confidence", 0.999))
+        brush_size = self.software.get_brush_size()
+
         start_time = time()
         end_time = start_time + timeout
         draw_counter = 0
+        check_counter = 0
+        batches_since_check = 0
         # Keeps looping untill no images are found, or the timer runs out
-        while (img_found := self.machine.count_all_image_occurances(image, **kwargs)) > 0:
+        while True:
             if time() > end_time:
                 raise RuntimeError("Images still found")
-            if images_found != img_found:
-                images_found = img_found
-                print(f"One image skrippled over, {img_found} left")
+
+            if estimator is None or estimator.all_predicted_broken() or batches_since_check >= max_batches_between_checks:
+                img_found = self.machine.count_all_image_occurances(image, **kwargs)
+                check_counter += 1
+                batches_since_check = 0
+                if img_found <= 0:
+                    break
+                if estimator is not None:
+                    estimator.calibrate(img_found)
+                if images_found != img_found:
+                    images_found = img_found
+                    print(f"One image skrippled over, {img_found} left")
             
-            draw_counter += 1
-            start_point = create_random_point_within_boundaries(boundaries)
-            end_point = create_random_point_within_boundaries(boundaries)
-            self.software.draw_line_freehand(start_point, end_point)
+            lines = []
+            for _ in range(lines_per_check):
+                start_point = create_random_point_within_boundaries(boundaries)
+                end_point = create_random_point_within_boundaries(boundaries)
+                lines.append([start_point, end_point])
+            draw_counter += len(lines)
+            with span("erasure batch", lines=len(lines), total_lines=draw_counter):
+                self.software.draw_batch(lines)
+            batches_since_check += 1
+            if estimator is not None:
+                for line in lines:
+                    estimator.add_stroke(line, brush_size)
         
         finish_time = time()
 
         elapsed = finish_time - start_time
         
-        print(f"No images found any more. Took {draw_counter} lines and {elapsed:.2f} seconds")
+        print(f"No images found any more. Took {draw_counter} lines, {check_counter} screen checks and {elapsed:.2f} seconds")
     
     def count_shapes_in_screen(self, shape: Shape):
         scr = shape.get_screenshot()
@@ -78,4 +193,20 @@ def create_painting_border_for_brush(draw_area: Box, brush_size: int) -> Box:
     top = draw_area.top + brush_width
     width = draw_area.width - brush_width
     height = draw_area.height - brush_width
-    return Box(left, top, width, height)
\ No newline at end of file
+    return Box(left, top, width, height)
+
+def plan_erasure_lines(boundaries: Box, shapes: list[Shape], brush_size: int, confidence: float, max_lines: int = 10000) -> list[list[Point]]:
+    """
+    Plans random erasure lines until the stroke coverage estimator predicts every shape broken.
+    Does not need the screen, the lines are what draw_random_lines_on_canvas_until_image_not_found
+    would draw before its first real check.
+    """
+    estimator = StrokeCoverageEstimator(shapes, confidence=confidence)
+    lines = []
+    while not estimator.all_predicted_broken():
+        if len(lines) >= max_lines:
+            raise RuntimeError(f"Shapes still predicted intact after {max_lines} lines")
+        line = [create_random_point_within_boundaries(boundaries), create_random_point_within_boundaries(boundaries)]
+        estimator.add_stroke(line, brush_size)
+        lines.append(line)
+    return lines
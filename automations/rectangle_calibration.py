@@ -0,0 +1,179 @@
+import numpy as np
+from PIL.Image import Image
+
+from typing import Optional
+
+from automations.gui import pyscreeze, clock
+from automations.calibration_store import CalibrationStore, get_machine_key
+from automations.binary_matching import INK_THRESHOLD
+from automations.matching import locate_all_in_image, pad_region
+from automations.software_base import SoftwareBase
+from shapes.common import Point, Box, Size
+from shapes.square import Square
+
+
+class RectangleToolCorrection:
+    """How far the edges of a rectangle tool square are from the freehand square with the same corners, by brush size.
+
+    Offsets are (left, top, right, bottom), the rectangle tool edge minus the freehand edge in pixels.
+    The drag of the rectangle tool is moved by the opposite amounts, so it draws the freehand square.
+
+    Args:
+        offsets (dict): Brush size -> (left, top, right, bottom) offsets
+
+    Examples:
+        >>> correction = RectangleToolCorrection({40: (-10, -10, 10, 10)})
+        >>> correction.get_drag(Square(Point(100, 100), Size(100, 100), 40))
+        (Point(x=110, y=110), Point(x=190, y=190))
+        >>> correction.get_drag(Square(Point(100, 100), Size(100, 100), 20)) is None
+        True
+    """
+    def __init__(self, offsets: Optional[dict[int, tuple[int, int, int, int]]] = None):
+        self.offsets = {int(brush_size): tuple(int(value) for value in edges) for brush_size, edges in (offsets or {}).items()}
+
+    def get_drag(self, square: Square) -> Optional[tuple[Point, Point]]:
+        """Start and end of the rectangle tool drag for the square, None if the brush size is not calibrated"""
+        if square.brush_size not in self.offsets:
+            return None
+        left, top, right, bottom = self.offsets[square.brush_size]
+        return (
+            Point(square.top_left.x - left, square.top_left.y - top),
+            Point(square.bottom_right.x - right, square.bottom_right.y - bottom)
+        )
+
+    def set_offsets(self, brush_size: int, offsets: tuple[int, int, int, int]):
+        self.offsets[int(brush_size)] = tuple(int(value) for value in offsets)
+
+    @classmethod
+    def load(cls, software_name: str, store: Optional[CalibrationStore] = None) -> "RectangleToolCorrection":
+        """Correction calibrated for the software on this machine, without any brush sizes if not calibrated yet"""
+        store = store or CalibrationStore()
+        # JSON keys are strings, the constructor turns them back to brush sizes
+        return cls(store.get("rectangle_tool", get_machine_key(software_name), {}))
+
+    def save(self, software_name: str, store: Optional[CalibrationStore] = None):
+        store = store or CalibrationStore()
+        store.set("rectangle_tool", get_machine_key(software_name), {str(brush_size): list(edges) for brush_size, edges in self.offsets.items()})
+
+
+def get_ink_box(region: Box) -> Optional[Box]:
+    """Captures the region and returns the bounding box of its ink on the screen, None if there is no ink"""
+    ink = np.asarray(pyscreeze.screenshot(region=tuple(region)).convert("L")) < INK_THRESHOLD
+    rows = np.nonzero(ink.any(axis=1))[0]
+    columns = np.nonzero(ink.any(axis=0))[0]
+    if not len(rows):
+        return None
+    return Box(
+        region.left + int(columns[0]), region.top + int(rows[0]),
+        int(columns[-1] - columns[0]) + 1, int(rows[-1] - rows[0]) + 1
+    )
+
+
+def get_edge_offsets(measured: Box, expected: Box) -> tuple[int, int, int, int]:
+    """
+    (left, top, right, bottom) edge differences of the boxes
+
+    Examples:
+        >>> get_edge_offsets(Box(70, 70, 160, 160), Box(80, 80, 140, 140))
+        (-10, -10, 10, 10)
+    """
+    return (
+        measured.left - expected.left,
+        measured.top - expected.top,
+        measured.left + measured.width - expected.left - expected.width,
+        measured.top + measured.height - expected.top - expected.height
+    )
+
+
+def calibrate_rectangle_tool(
+        software: SoftwareBase,
+        area: Box,
+        square_size: Size = Size(100, 100),
+        correction: Optional[RectangleToolCorrection] = None,
+        confidence: float = 0.98,
+        settle_time: float = 0.3
+        ) -> RectangleToolCorrection:
+    """
+    Measures the size offset of the rectangle tool for the current brush size of the software.
+    A test square is drawn freehand and with the rectangle tool from the same corners, and the ink
+    boxes of the two are compared. The corrected rectangle tool square is then drawn once more, and it
+    has to match the freehand square as a template. Every test square is undone, so the area has to be empty paper.
+
+    Args:
+        software (SoftwareBase): Open software with an empty drawing.
+        area (Box): Part of the drawing the test squares are drawn in.
+        square_size (Size): Size of the test squares.
+        correction (RectangleToolCorrection, optional): Earlier correction, the other brush sizes are kept.
+        confidence (float): How well the corrected square has to match the freehand one.
+        settle_time (float): Wait after each drawing and undo before capturing it.
+
+    Raises:
+        RuntimeError: If a test square is not drawn, an undo does not clear it, or the corrected square does not match.
+
+    Examples:
+        The offset of an offline document's rectangle tool is found from its screen:
+            >>> from automations import gui
+            >>> from automations.offline import OfflineDocument
+            >>> class Document(OfflineDocument):
+            ...     def draw_square_freehand(self, square):
+            ...         self.checkpoint()
+            ...         super().draw_square_freehand(square)
+            ...     def draw_squares_rectangle_tool(self, squares, correction=None):
+            ...         self.checkpoint()
+            ...         super().draw_squares_rectangle_tool(squares, correction)
+            >>> class Screen:
+            ...     def screenshot(self, region=None):
+            ...         left, top, width, height = region
+            ...         return document.get_merged_image().crop((left, top, left + width, top + height))
+            ...     def sleep(self, seconds):
+            ...         pass
+            ...     def __getattr__(self, name):
+            ...         return getattr(gui.pyscreeze.target_under(self), name)
+            >>> document = Document(brush_size=20, rectangle_tool_offsets={20: (-10, -10, 10, 10)})
+            >>> document.start_new_drawing(Size(300, 300))
+            >>> screen = Screen()
+            >>> gui.pyscreeze.push_override(screen); gui.clock.push_override(screen)
+            >>> calibrate_rectangle_tool(document, Box(0, 0, 300, 300), square_size=Size(80, 80)).offsets
+            Rectangle tool edges are off by (-10, -10, 10, 10) with brush size 20
+            {20: (-10, -10, 10, 10)}
+            >>> gui.pyscreeze.pop_override(); gui.clock.pop_override()
+    """
+    brush_size = software.get_brush_size()
+    correction = correction or RectangleToolCorrection()
+    square = Square(Point(area.left + brush_size * 2, area.top + brush_size * 2), square_size, brush_size)
+    # The uncorrected rectangle can be larger than the freehand square
+    region = pad_region(square.get_bounding_box(), brush_size, (area.left + area.width, area.top + area.height))
+
+    def draw_and_measure(draw) -> tuple[Box, Image]:
+        draw()
+        clock.sleep(settle_time)
+        ink_box = get_ink_box(region)
+        capture = pyscreeze.screenshot(region=tuple(region))
+        software.undo()
+        clock.sleep(settle_time)
+        if get_ink_box(region) is not None:
+            raise RuntimeError("Undo did not clear the rectangle tool test square")
+        if ink_box is None:
+            raise RuntimeError("Rectangle tool test square was not drawn")
+        return ink_box, capture
+
+    freehand_box, freehand_capture = draw_and_measure(lambda: software.draw_square_freehand(square))
+    template = freehand_capture.crop(_get_relative_box(square.get_screenshot_region(), region))
+
+    # The uncorrected offsets first, then check the correction with them
+    correction.set_offsets(brush_size, (0, 0, 0, 0))
+    rectangle_box, _ = draw_and_measure(lambda: software.draw_squares_rectangle_tool([square], correction))
+    offsets = get_edge_offsets(rectangle_box, freehand_box)
+    correction.set_offsets(brush_size, offsets)
+    print(f"Rectangle tool edges are off by {offsets} with brush size {brush_size}")
+
+    corrected_box, corrected_capture = draw_and_measure(lambda: software.draw_squares_rectangle_tool([square], correction))
+    if not locate_all_in_image(template, corrected_capture, confidence=confidence, limit=1):
+        raise RuntimeError(f"Corrected rectangle tool square does not match the freehand one, its ink box is {corrected_box} instead of {freehand_box}")
+    return correction
+
+
+def _get_relative_box(box: tuple[int, int, int, int], region: Box) -> tuple[int, int, int, int]:
+    """Box on the screen as a (left, top, right, bottom) crop of the region's capture"""
+    left, top = box[0] - region.left, box[1] - region.top
+    return (left, top, left + box[2], top + box[3])
@@ -1,12 +1,24 @@
-from pyscreeze import Point, Box
+from typing import Optional
+
+from automations.layout_cache import LayoutCache
+from shapes.common import Point, Box
 from shapes.square import Square
 
 class SoftwareBase:
     """Base class for each drawing application. Create new class for each application"""
+    # Key combinations that can be sent again without changing anything, e.g. selecting the same tool
+    idempotent_keys: tuple[tuple[str, ...], ...] = ()
+    # Remembered UI element positions, set by Machine.open_software
+    layout: Optional[LayoutCache] = None
+
     def __init__(self) -> None:
         self.software_name = None
         self.scr_directories = {}
 
+    def get_software_version(self) -> str:
+        """UI layout is remembered separately for each version of the software"""
+        return "unknown"
+
     def start_new_drawing(self, width: int, height: int):
         raise NotImplementedError
     
@@ -18,8 +30,14 @@ class SoftwareBase:
     
     def draw_square_freehand(self, square: Square):
         raise NotImplementedError
+
+    def draw_squares_rectangle_tool(self, squares: list[Square], correction=None):
+        """Draws each square with one drag of the rectangle tool. The squares match the freehand ones
+        when the tool is calibrated, see rectangle_calibration.py"""
+        raise NotImplementedError
     
-    def draw_line_freehand(self, start: Point, end: Point):
+    def draw_line_freehand(self, start: Point, end: Point, duration: Optional[float] = None):
+        """Duration of the drag defaults to what the software needs for the segment length"""
         raise NotImplementedError
     
     def draw_continues_lines(self, start: Point, points: list[Point]):
@@ -27,7 +45,15 @@ class SoftwareBase:
     
     def draw_continues_lines_freehand(self, points: list[Point]):
         raise NotImplementedError
+
+    def draw_batch(self, strokes: list[list[Point]]):
+        """Draws all the strokes as one transaction.
+        Tool mode and brush state are set only once and the strokes are ordered to keep pen-up travel short"""
+        raise NotImplementedError
     
+    def undo(self):
+        raise NotImplementedError
+
     def close_application(self, save: bool = False):
         raise NotImplementedError
     
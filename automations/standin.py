@@ -0,0 +1,145 @@
+from PIL import Image as PILImage
+from PIL.Image import Image
+
+import os
+import subprocess
+import sys
+from typing import Optional
+
+from automations.gui import span
+from automations.drag_calibration import DragSpeedCurve
+from automations.rectangle_calibration import RectangleToolCorrection
+from automations.krita import Krita
+from automations.machine import Machine
+from automations.matching import locate_on_screen
+from automations.offline import render_square_template
+from shapes.common import Point, Size
+
+#
+#   LAYOUT
+#
+# Shared by the stand-in app and the template generation, so the templates match the app pixel for pixel
+BACKGROUND_COLOR = (96, 96, 96)
+FRAME_COLOR = (0, 90, 180)
+FRAME_WIDTH = 2
+STATE_MARKER_POSITION = Point(8, 8)
+STATE_MARKER_BAR = Size(20, 24)
+# Top left corner of the drawing area, inside the frame
+CANVAS_ORIGIN = Point(16, 48)
+CANVAS_MARGIN = 16
+MARKER_PALETTE = ((230, 60, 60), (60, 180, 75), (0, 130, 200), (245, 130, 48))
+# Every UI state shows its own row of colored bars in the top left corner
+STATE_CODES = {
+    "open_empty": (0, 1, 2, 3, 0, 1, 2, 3),
+    "new_document": (3, 3, 0, 0, 1, 1, 2, 2),
+    "document": (1, 0, 3, 2, 1, 0, 3, 2),
+    "save_prompt": (2, 2, 2, 0, 0, 0, 3, 1),
+}
+
+
+def render_state_marker(state: str) -> Image:
+    """Row of colored bars the stand-in app shows for the state
+
+    Examples:
+        >>> render_state_marker("document").size
+        (160, 24)
+    """
+    code = STATE_CODES[state]
+    marker = PILImage.new("RGB", (STATE_MARKER_BAR.width * len(code), STATE_MARKER_BAR.height))
+    for index, color in enumerate(code):
+        left = index * STATE_MARKER_BAR.width
+        marker.paste(MARKER_PALETTE[color], (left, 0, left + STATE_MARKER_BAR.width, STATE_MARKER_BAR.height))
+    return marker
+
+
+def render_framed_canvas(canvas: Image) -> Image:
+    """Canvas with the frame the stand-in app draws around the document"""
+    framed = PILImage.new("RGB", (canvas.width + FRAME_WIDTH * 2, canvas.height + FRAME_WIDTH * 2), FRAME_COLOR)
+    framed.paste(canvas, (FRAME_WIDTH, FRAME_WIDTH))
+    return framed
+
+
+def get_screen_size_for_canvas(canvas_size: Size) -> Size:
+    """Smallest screen that fits a canvas of the size in the stand-in app"""
+    return Size(
+        CANVAS_ORIGIN.x + canvas_size.width + FRAME_WIDTH + CANVAS_MARGIN,
+        CANVAS_ORIGIN.y + canvas_size.height + FRAME_WIDTH + CANVAS_MARGIN
+    )
+
+
+def generate_templates(screenshots_directory: str, canvas_size: Size = Size(2560, 1440), brush_size: int = 40) -> str:
+    """
+    Writes the templates of the stand-in app with the same names the Krita automation uses.
+    The stand-in draws with the same brush as the offline renderer, so the shape templates are rendered too.
+
+    Returns:
+        str: Directory of the stand-in templates, give it to StandinPaint
+    """
+    directory = os.path.join(screenshots_directory, "standin")
+    for subdirectory in ("new_document_window", "drawing_window", "shapes"):
+        os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    render_state_marker("open_empty").save(os.path.join(directory, "open_empty.png"))
+    render_state_marker("new_document").save(os.path.join(directory, "new_document_window", "window_title.png"))
+    render_state_marker("new_document").save(os.path.join(directory, "new_document_window", "window_title_unactive.png"))
+    render_state_marker("document").save(os.path.join(directory, "new_document_window", "document_empty_2k_landscape.png"))
+
+    empty_canvas = PILImage.new("RGB", (canvas_size.width, canvas_size.height), (255, 255, 255))
+    render_framed_canvas(empty_canvas).save(os.path.join(directory, "empty_2k_paper.png"))
+
+    square = render_square_template(Size(100, 100), brush_size)
+    square.save(os.path.join(directory, "shapes", f"square_freehand_{brush_size}_100_100_black_on_white.png"))
+    return directory
+
+
+#
+#   AUTOMATION
+#
+class StandinPaint(Krita):
+    """
+    Automation of the stand-in drawing app (automations/standin_app.py).
+    The app has the hotkeys and dialog flow of Krita, so only starting and closing it differ.
+    """
+    def __init__(self, screenshots_directory: str, screen_size: Size) -> None:
+        super().__init__(screenshots_directory)
+        self.software_name = "StandinPaint"
+        self.drag_speed_curve = DragSpeedCurve.load(self.software_name)
+        self.rectangle_correction = RectangleToolCorrection.load(self.software_name)
+        self.screen_size = screen_size
+        self.process: Optional[subprocess.Popen] = None
+
+    def get_software_version(self) -> str:
+        # The app is part of this repository, there is no krita to ask
+        return "standin"
+
+    def launch(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "automations.standin_app", "--screen", f"{self.screen_size.width}x{self.screen_size.height}"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+
+    def wait_for_exit(self, timeout: float) -> bool:
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+
+class StandinMachine(Machine):
+    """Machine without a desktop environment: the software is started directly instead of from the window selector"""
+    def open_software(self, software: StandinPaint):
+        if self.input_scheduler is not None:
+            self.input_scheduler.idempotent_keys.update(software.idempotent_keys)
+        layout = self.load_layout(software)
+        software.launch()
+        locate_on_screen(f"{software.scr_directories['base']}/open_empty.png", 10, confidence=0.9, layout=layout)
+
+    def close_software(self, software: StandinPaint):
+        with span("close application", software=software.software_name):
+            software.close_application()
+        # Queued input has to be sent before waiting for the app to exit
+        if self.input_scheduler is not None:
+            self.input_scheduler.flush()
+        if not software.wait_for_exit(10):
+            raise RuntimeError(f"{software.software_name} is still runnning")
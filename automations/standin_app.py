@@ -0,0 +1,192 @@
+"""
+Minimal drawing app for the end-to-end harness, started with: python -m automations.standin_app --screen 2592x1504
+
+Has the parts of Krita the automation uses: a new document dialog (ctrl+n, alt+i width, alt+h height,
+alt+c create), freehand (b) and rectangle (shift+r) brush modes, brush size ([ and ]), undo (ctrl+z)
+and quit with a save prompt (ctrl+q, alt+n). The strokes are rendered by the offline renderer, and the
+current UI state is shown as a marker, so every template can be generated with automations.standin.
+
+A freehand stroke is kept as the motion events drew it. Fast drags, dropped motion events and input latency
+show up on the canvas the same way they would in Krita, so the harness catches them.
+"""
+import argparse
+import tkinter
+
+from PIL import ImageTk
+
+from automations.offline import OfflineDocument
+from automations.standin import (
+    BACKGROUND_COLOR, CANVAS_ORIGIN, CANVAS_MARGIN, FRAME_WIDTH, STATE_MARKER_POSITION,
+    render_framed_canvas, render_state_marker
+)
+from shapes.common import Point, Size
+
+# Alt is the first modifier with the default keymap of Xvfb
+CONTROL_MASK = 0x4
+ALT_MASK = 0x8
+
+
+class StandinApp:
+    def __init__(self, root: tkinter.Tk, screen: Size):
+        self.root = root
+        self.screen = screen
+        self.document = OfflineDocument(brush_size=40)
+        self.state = "open_empty"
+        self.mode = "freehand"
+        self.modified = False
+        self.dialog_field = "width"
+        self.dialog_values = {"width": "", "height": ""}
+        self.stroke_points: list[Point] = []
+        self._refresh_pending = False
+
+        self.canvas = tkinter.Canvas(root, width=screen.width, height=screen.height, highlightthickness=0, bg="#%02x%02x%02x" % BACKGROUND_COLOR)
+        self.canvas.place(x=0, y=0)
+        self.marker_item = self.canvas.create_image(*STATE_MARKER_POSITION, anchor="nw")
+        self.document_item = self.canvas.create_image(CANVAS_ORIGIN.x - FRAME_WIDTH, CANVAS_ORIGIN.y - FRAME_WIDTH, anchor="nw")
+        self._photos = {}
+
+        root.bind("<Key>", self.on_key)
+        self.canvas.bind("<ButtonPress-1>", self.on_press)
+        self.canvas.bind("<B1-Motion>", self.on_motion)
+        self.canvas.bind("<ButtonRelease-1>", self.on_release)
+        self.set_state("open_empty")
+
+    #
+    #   STATE
+    #
+    def set_state(self, state: str):
+        self.state = state
+        self._photos["marker"] = ImageTk.PhotoImage(render_state_marker(state))
+        self.canvas.itemconfigure(self.marker_item, image=self._photos["marker"])
+
+    def refresh_document(self):
+        """Redraws the document once per batch of events, not for every mouse motion"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.root.after_idle(self._refresh_document)
+
+    def _refresh_document(self):
+        self._refresh_pending = False
+        if self.document.strokes_layer is None:
+            self.canvas.itemconfigure(self.document_item, image="")
+            return
+        self._photos["document"] = ImageTk.PhotoImage(render_framed_canvas(self.document.get_merged_image()))
+        self.canvas.itemconfigure(self.document_item, image=self._photos["document"])
+
+    def create_document(self):
+        max_width = self.screen.width - CANVAS_ORIGIN.x - FRAME_WIDTH - CANVAS_MARGIN
+        max_height = self.screen.height - CANVAS_ORIGIN.y - FRAME_WIDTH - CANVAS_MARGIN
+        width = min(int(self.dialog_values["width"] or max_width), max_width)
+        height = min(int(self.dialog_values["height"] or max_height), max_height)
+        self.document.start_new_drawing(Size(width, height))
+        self.modified = False
+        self.set_state("document")
+        self.refresh_document()
+
+    #
+    #   KEYBOARD
+    #
+    def on_key(self, event: tkinter.Event):
+        key = event.keysym.lower()
+        control = event.state & CONTROL_MASK
+        alt = event.state & ALT_MASK
+
+        if control and key == "q":
+            if self.modified:
+                self.set_state("save_prompt")
+            else:
+                self.root.destroy()
+        elif self.state == "save_prompt" and alt and key == "n":
+            self.root.destroy()
+        elif control and key == "n":
+            self.dialog_values = {"width": "", "height": ""}
+            self.dialog_field = "width"
+            self.set_state("new_document")
+        elif self.state == "new_document":
+            self.on_dialog_key(key, alt)
+        elif self.state == "document":
+            self.on_document_key(key, control, event.keysym)
+
+    def on_dialog_key(self, key: str, alt: int):
+        if alt and key == "i":
+            self.dialog_field = "width"
+            self.dialog_values["width"] = ""
+        elif alt and key == "h":
+            self.dialog_field = "height"
+            self.dialog_values["height"] = ""
+        elif alt and key == "c":
+            self.create_document()
+        elif key.isdigit():
+            self.dialog_values[self.dialog_field] += key
+
+    def on_document_key(self, key: str, control: int, keysym: str):
+        if control and key == "z":
+            self.document.undo()
+            self.refresh_document()
+        elif keysym == "b":
+            self.mode = "freehand"
+        elif keysym == "R":
+            self.mode = "rectangle"
+        elif keysym == "bracketright":
+            self.document.brush_size_increase()
+        elif keysym == "bracketleft":
+            self.document.brush_size_decrease()
+
+    #
+    #   MOUSE
+    #
+    def to_document(self, event: tkinter.Event) -> Point:
+        return Point(event.x - CANVAS_ORIGIN.x, event.y - CANVAS_ORIGIN.y)
+
+    def on_press(self, event: tkinter.Event):
+        if self.state != "document":
+            return
+        self.document.checkpoint()
+        self.stroke_points = [self.to_document(event)]
+        if self.mode == "freehand":
+            self.document.draw_continues_lines_freehand(self.stroke_points)
+            self.modified = True
+            self.refresh_document()
+
+    def on_motion(self, event: tkinter.Event):
+        if self.state != "document" or not self.stroke_points:
+            return
+        point = self.to_document(event)
+        if self.mode == "freehand":
+            self.document.draw_line_freehand(self.stroke_points[-1], point)
+            self.refresh_document()
+        self.stroke_points.append(point)
+
+    def on_release(self, event: tkinter.Event):
+        if self.state != "document" or not self.stroke_points:
+            return
+        point = self.to_document(event)
+        if self.mode == "rectangle":
+            # The rectangle tool draws from the press to the release position, like in Krita
+            start = self.stroke_points[0]
+            self.document.draw_continues_lines_freehand([start, Point(point.x, start.y), point, Point(start.x, point.y), start])
+        elif point != self.stroke_points[-1]:
+            self.document.draw_line_freehand(self.stroke_points[-1], point)
+        self.modified = True
+        self.stroke_points = []
+        self.refresh_document()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stand-in drawing app for the end-to-end harness")
+    parser.add_argument('--screen', type=str, default="2592x1504", help='Width x height of the screen the app fills')
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.screen.split("x"))
+    args.screen = Size(width, height)
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    root = tkinter.Tk()
+    # No window manager on the test display, the app covers the whole screen itself
+    root.overrideredirect(True)
+    root.geometry(f"{args.screen.width}x{args.screen.height}+0+0")
+    app = StandinApp(root, args.screen)
+    root.focus_force()
+    root.mainloop()
@@ -0,0 +1,150 @@
+import numpy as np
+from PIL.Image import Image
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+from automations import gui
+from shapes.common import Box
+
+# Threads used for the tiles can be set with this environment variable
+MATCH_WORKERS_VARIABLE = "PYTHON_PAINTER_MATCH_WORKERS"
+
+
+def get_default_match_workers() -> int:
+    """
+    Threads used for the tiles: the environment variable if it is a positive number, the CPU count otherwise
+
+    Examples:
+        >>> os.environ[MATCH_WORKERS_VARIABLE] = "3"
+        >>> get_default_match_workers()
+        3
+        >>> os.environ[MATCH_WORKERS_VARIABLE] = "many"
+        >>> get_default_match_workers() == (os.cpu_count() or 1)
+        True
+        >>> del os.environ[MATCH_WORKERS_VARIABLE]
+    """
+    try:
+        workers = int(os.environ.get(MATCH_WORKERS_VARIABLE, ""))
+    except ValueError:
+        workers = 0
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+class TiledMatcher(gui.PyScreezeOverride):
+    """Stand-in for pyscreeze that matches large frames in tiles on a thread pool.
+
+    The frame is split into horizontal bands of match positions. Each band is matched against the
+    rows it covers plus the template height, so every position is computed in exactly one tile and
+    nothing has to be deduplicated at the borders. The matches of the bands are merged back into the
+    row by row order pyscreeze returns them in, before the limit is applied.
+
+    Tile sizes depend only on the frame and the template, never on the worker count, so the results
+    are identical whatever the number of workers, one worker included. OpenCV releases the GIL while
+    matching, so the tiles run in parallel.
+
+    Args:
+        workers (int, optional): Threads used for the tiles. Defaults to get_default_match_workers() at the first match.
+        tile_rows (int): Match positions per band. Grows to four template heights for tall templates.
+
+    Examples:
+        Matches that straddle the tile borders are found once, in the order pyscreeze gives them:
+            >>> import pyscreeze
+            >>> from PIL import Image, ImageDraw
+            >>> haystack = Image.new("RGB", (200, 200), "white")
+            >>> draw = ImageDraw.Draw(haystack)
+            >>> for left, top in [(10, 5), (60, 88), (110, 96), (150, 99), (20, 130), (70, 150)]:
+            ...     draw.rectangle((left, top, left + 20, top + 20), outline="black", width=3)
+            >>> needle = haystack.crop((8, 3, 33, 28))
+            >>> matcher = TiledMatcher(workers=2, tile_rows=16)
+            >>> matcher.enabled = True
+            >>> gui.pyscreeze.push_override(matcher)
+            >>> tiled = [tuple(box) for box in matcher.locateAll(needle, haystack, confidence=0.9)]
+            >>> gui.pyscreeze.pop_override()
+            >>> tiled == [tuple(box) for box in pyscreeze.locateAll(needle, haystack, confidence=0.9)]
+            True
+            >>> len(tiled)
+            6
+    """
+    own_attributes = ("workers", "tile_rows", "enabled")
+
+    def __init__(self, workers: Optional[int] = None, tile_rows: int = 256):
+        self.workers = workers
+        self.tile_rows = tile_rows
+        # Tiling only pays off when there are cores for the tiles
+        self.enabled = (os.cpu_count() or 1) > 1
+        # Thread pool is kept between the matches, made again only when the worker count changes
+        self._executor = None
+        self._executor_workers = 0
+
+    def get_tile_rows(self, needle_height: int) -> int:
+        return max(self.tile_rows, needle_height * 4)
+
+    def get_workers(self) -> int:
+        if self.workers is None:
+            self.workers = get_default_match_workers()
+        return self.workers
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        workers = self.get_workers()
+        if self._executor is None or self._executor_workers != workers:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+            self._executor_workers = workers
+        return self._executor
+
+    def locateAll(self, needleImage, haystackImage, grayscale: Optional[bool] = None, limit: int = 10000, region=None, step: int = 1, confidence: float = 0.999):
+        """Same arguments and results as pyscreeze.locateAll"""
+        inner = self._inner
+        if grayscale is None:
+            grayscale = inner.GRAYSCALE_DEFAULT
+        if not self.enabled or region is not None or step != 1:
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, region=region, step=step, confidence=confidence)
+
+        needle = load_cv2_image(needleImage, grayscale)
+        haystack = load_cv2_image(haystackImage, grayscale)
+        result_rows = haystack.shape[0] - needle.shape[0] + 1
+        tile_rows = self.get_tile_rows(needle.shape[0])
+        if result_rows <= tile_rows or haystack.shape[1] < needle.shape[1]:
+            return inner.locateAll(needleImage, haystackImage, grayscale=grayscale, limit=limit, confidence=confidence)
+
+        tops = range(0, result_rows, tile_rows)
+        def match_tile(top: int) -> tuple[np.ndarray, np.ndarray]:
+            bottom = min(top + tile_rows, result_rows)
+            return _match_positions(haystack[top:bottom + needle.shape[0] - 1], needle, float(confidence), top)
+
+        if self.get_workers() > 1:
+            tiles = list(self.get_executor().map(match_tile, tops))
+        else:
+            tiles = [match_tile(top) for top in tops]
+
+        # Bands are in row order and each is row by row already
+        ys = np.concatenate([tile[0] for tile in tiles])[:limit]
+        xs = np.concatenate([tile[1] for tile in tiles])[:limit]
+        if len(ys) == 0 and getattr(inner, "USE_IMAGE_NOT_FOUND_EXCEPTION", True):
+            raise inner.ImageNotFoundException("Could not locate the image")
+        needle_height, needle_width = needle.shape[:2]
+        return [Box(int(x), int(y), needle_width, needle_height) for x, y in zip(xs, ys)]
+
+
+def _match_positions(haystack: np.ndarray, needle: np.ndarray, confidence: float, top: int) -> tuple[np.ndarray, np.ndarray]:
+    import cv2
+    result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    ys, xs = np.nonzero(result > confidence)
+    return ys + top, xs
+
+
+def load_cv2_image(image: Union[str, Image, np.ndarray], grayscale: bool) -> np.ndarray:
+    """Loads the image the way pyscreeze does: BGR, or grayscale converted from BGR"""
+    import cv2
+    if isinstance(image, str):
+        return cv2.imread(image, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    if isinstance(image, np.ndarray):
+        pixels = image
+    else:
+        pixels = np.array(image.convert("RGB"))[:, :, ::-1]
+    if grayscale and pixels.ndim == 3:
+        return cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY)
+    return np.ascontiguousarray(pixels)
@@ -0,0 +1,176 @@
+import numpy as np
+from PIL.Image import Image
+
+import json
+import os
+import threading
+from time import perf_counter
+from typing import Any, Optional
+
+from automations import gui
+
+
+class Tracer:
+    """Records a span for every low level operation of a run and writes them as a Chrome trace.
+
+    While active, the gui modules are wrapped so every screenshot, match, input action and sleep
+    becomes a span with its arguments. Phases, waits and the spans marked with gui.span (template
+    matches, poll iterations, drawing batches) are recorded from the gui events. The written
+    file opens in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+    With the input scheduler installed, the input actions are recorded when the queue is sent,
+    which is also when they really happen.
+
+    Examples:
+        >>> class Keyboard:
+        ...     def hotkey(self, *keys):
+        ...         pass
+        >>> gui.pyautogui.push_override(Keyboard())
+        >>> with Tracer() as tracer:
+        ...     with gui.span("match", template="square.png", confidence=0.98) as details:
+        ...         gui.pyautogui.hotkey("ctrl", "z")
+        ...         details["found"] = 2
+        >>> gui.pyautogui.pop_override()
+        >>> [(event["name"], event["args"]) for event in tracer.events]
+        [('hotkey', {'args': ['ctrl', 'z']}), ('match', {'template': 'square.png', 'confidence': 0.98, 'found': 2})]
+    """
+    # Module name -> traced functions
+    traced_actions = {
+        "pyautogui": ("press", "hotkey", "write", "click", "moveTo", "dragTo", "mouseDown", "mouseUp", "keyDown", "keyUp"),
+        "pyscreeze": ("screenshot", "locateAll", "countAll"),
+        "pywinctl": ("getAllTitles", "getActiveWindow", "getAllScreens"),
+        "time": ("sleep",),
+    }
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self._start = perf_counter()
+        self._pid = os.getpid()
+        self._open_spans: dict[int, list[tuple[str, float]]] = {}
+        self._wait_details: dict = {}
+        self._modules = [gui.pyautogui, gui.pyscreeze, gui.pywinctl, gui.clock]
+
+    def __enter__(self) -> "Tracer":
+        for module in self._modules:
+            module.push_override(_TracedModule(self, module, self.traced_actions[module.module_name]))
+        gui.add_observer(self._on_event)
+        return self
+
+    def __exit__(self, *exc_info):
+        gui.remove_observer(self._on_event)
+        for module in self._modules:
+            module.pop_override()
+
+    #
+    #   RECORDING
+    #
+    def now(self) -> float:
+        """Microseconds since the tracer was created, the trace event time unit"""
+        return (perf_counter() - self._start) * 1e6
+
+    def add_span(self, name: str, category: str, start: float, end: float, args: Optional[dict] = None):
+        self.events.append({
+            "name": name, "cat": category, "ph": "X",
+            "ts": start, "dur": end - start,
+            "pid": self._pid, "tid": threading.get_native_id(),
+            "args": {key: _to_json(value) for key, value in (args or {}).items()},
+        })
+
+    def _begin(self, name: str):
+        self._open_spans.setdefault(threading.get_native_id(), []).append((name, self.now()))
+
+    def _end(self, name: str, category: str, args: dict):
+        stack = self._open_spans.get(threading.get_native_id())
+        # A span that started before the tracer has no start to pair with
+        if not stack or stack[-1][0] != name:
+            return
+        _, start = stack.pop()
+        self.add_span(name, category, start, self.now(), args)
+
+    def _on_event(self, event: str, details: dict):
+        if event == "phase_start":
+            self._begin(details["name"])
+        elif event == "phase_end":
+            self._end(details["name"], "phase", {})
+        elif event == "span_start":
+            self._begin(details["name"])
+        elif event == "span_end":
+            self._end(details["name"], "span", details["details"])
+        elif event == "wait":
+            self._begin("wait")
+            self._wait_details = details
+        elif event == "wait_result":
+            self._end("wait", "wait", {**self._wait_details, **details})
+
+    #
+    #   OUTPUT
+    #
+    def get_trace(self) -> dict:
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": "python_painter"}}]
+        for tid in sorted({event["tid"] for event in self.events}):
+            name = "main" if tid == threading.main_thread().native_id else f"thread {tid}"
+            metadata.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+        return {"traceEvents": metadata + sorted(self.events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        with open(path, "w") as trace_file:
+            json.dump(self.get_trace(), trace_file)
+        print(f"Trace of {len(self.events)} spans written to {path}")
+
+
+class _TracedModule:
+    def __init__(self, tracer: Tracer, module: gui.LazyModule, actions: tuple[str, ...]):
+        object.__setattr__(self, "_tracer", tracer)
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "_actions", actions)
+
+    @property
+    def _inner(self):
+        return self._module.target_under(self)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._inner, name)
+        if name not in self._actions:
+            return attribute
+
+        def traced(*args, **kwargs):
+            tracer = self._tracer
+            start = tracer.now()
+            try:
+                result = attribute(*args, **kwargs)
+                if name == "locateAll":
+                    # Matching runs lazily while the generator is consumed
+                    result = list(result)
+            finally:
+                tracer.add_span(name, self._module.module_name, start, tracer.now(), _describe_call(args, kwargs))
+            return result
+        return traced
+
+    def __setattr__(self, name: str, value):
+        setattr(self._inner, name, value)
+
+
+def _describe_call(args: tuple, kwargs: dict) -> dict:
+    details = {}
+    if args:
+        details["args"] = list(args)
+    details.update(kwargs)
+    region = kwargs.get("region")
+    if region is not None:
+        details["pixels"] = region[2] * region[3]
+    return details
+
+
+def _to_json(value: Any) -> Any:
+    """Keeps the span arguments small and serializable: images become their size, unknown objects their type"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, Image):
+        return f"image {value.width}x{value.height}"
+    return type(value).__name__
@@ -0,0 +1,194 @@
+import json
+import os
+import select
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Optional
+
+from automations import gui
+from shapes.common import Size
+
+
+class XvfbDisplay:
+    """Starts a virtual X display and points DISPLAY to it while active.
+
+    pyautogui connects to the display when it is imported, so nothing may have imported it before.
+    The GUI modules are imported lazily, so this holds unless a run was already made in the process.
+
+    Args:
+        screen (Size): Size of the virtual screen.
+        startup_timeout (float): How long to wait for Xvfb to accept connections.
+    """
+    def __init__(self, screen: Size, startup_timeout: float = 10):
+        self.screen = screen
+        self.startup_timeout = startup_timeout
+        self.display: Optional[str] = None
+        self.process: Optional[subprocess.Popen] = None
+        self._previous_display: Optional[str] = None
+
+    def __enter__(self) -> "XvfbDisplay":
+        if "pyautogui" in sys.modules:
+            raise RuntimeError("pyautogui was imported before the virtual display was started and keeps using the old display")
+
+        read_fd, write_fd = os.pipe()
+        try:
+            # Xvfb picks a free display number and writes it to the given file descriptor
+            self.process = subprocess.Popen(
+                ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", f"{self.screen.width}x{self.screen.height}x24", "-nolisten", "tcp"],
+                pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            os.close(read_fd)
+            raise RuntimeError("Xvfb is not installed") from None
+        finally:
+            os.close(write_fd)
+
+        with os.fdopen(read_fd) as display_pipe:
+            ready, _, _ = select.select([display_pipe], [], [], self.startup_timeout)
+            number = display_pipe.readline().strip() if ready else ""
+        if not number:
+            self.process.kill()
+            raise RuntimeError(f"Xvfb did not start in {self.startup_timeout} s")
+
+        self.display = f":{number}"
+        self._previous_display = os.environ.get("DISPLAY")
+        os.environ["DISPLAY"] = self.display
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._previous_display is None:
+            os.environ.pop("DISPLAY", None)
+        else:
+            os.environ["DISPLAY"] = self._previous_display
+        self.process.terminate()
+        self.process.wait()
+
+
+class RunRecorder:
+    """Records the phase durations, the wait latencies and the drawn strokes of one run from the gui events"""
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.wait_latencies: list[float] = []
+        self.strokes = 0
+        self._phase_starts: dict[str, float] = {}
+        self._wait_start: Optional[float] = None
+
+    def __enter__(self) -> "RunRecorder":
+        gui.add_observer(self._on_event)
+        return self
+
+    def __exit__(self, *exc_info):
+        gui.remove_observer(self._on_event)
+
+    def _on_event(self, event: str, details: dict):
+        if event == "phase_start":
+            self._phase_starts[details["name"]] = perf_counter()
+        elif event == "phase_end":
+            self.phases[details["name"]] = perf_counter() - self._phase_starts.pop(details["name"])
+        elif event == "wait":
+            self._wait_start = perf_counter()
+        elif event == "wait_result" and self._wait_start is not None:
+            if details["found"]:
+                self.wait_latencies.append(perf_counter() - self._wait_start)
+            self._wait_start = None
+        elif event == "span_end" and details["name"] == "stroke":
+            self.strokes += 1
+
+    def get_result(self) -> dict:
+        drawing_seconds = self.phases.get("Drawing squares", 0.0) + self.phases.get("Erasing squares", 0.0)
+        return {
+            "phases": self.phases,
+            "total_seconds": sum(self.phases.values()),
+            "median_wait_latency": statistics.median(self.wait_latencies) if self.wait_latencies else None,
+            "strokes_per_second": self.strokes / drawing_seconds if drawing_seconds else None,
+        }
+
+
+def summarize_runs(results: list[dict]) -> dict:
+    """Median of every measurement over the runs
+
+    Examples:
+        >>> summarize_runs([
+        ...     {"phases": {"Drawing squares": 2.0}, "total_seconds": 2.0, "median_wait_latency": 0.1, "strokes_per_second": 4.0},
+        ...     {"phases": {"Drawing squares": 4.0}, "total_seconds": 4.0, "median_wait_latency": 0.3, "strokes_per_second": 2.0},
+        ... ])
+        {'runs': 2, 'phases': {'Drawing squares': 3.0}, 'total_seconds': 3.0, 'median_wait_latency': 0.2, 'strokes_per_second': 3.0}
+    """
+    phases = {}
+    for result in results:
+        for name, seconds in result["phases"].items():
+            phases.setdefault(name, []).append(seconds)
+
+    def median(key: str) -> Optional[float]:
+        values = [result[key] for result in results if result[key] is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "runs": len(results),
+        "phases": {name: statistics.median(values) for name, values in phases.items()},
+        "total_seconds": median("total_seconds"),
+        "median_wait_latency": median("median_wait_latency"),
+        "strokes_per_second": median("strokes_per_second"),
+    }
+
+
+def compare_to_baseline(summary: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """Measurements that are more than tolerance worse than the baseline
+
+    Examples:
+        >>> baseline = {"phases": {"Drawing squares": 2.0}, "total_seconds": 10.0, "median_wait_latency": 0.1, "strokes_per_second": 4.0}
+        >>> summary = {"phases": {"Drawing squares": 3.0}, "total_seconds": 11.0, "median_wait_latency": 0.1, "strokes_per_second": 2.0}
+        >>> compare_to_baseline(summary, baseline)
+        ['Drawing squares took 3.00 s, baseline 2.00 s', 'strokes_per_second 2.00, baseline 4.00']
+    """
+    regressions = []
+    for name, seconds in summary["phases"].items():
+        if name in baseline["phases"] and seconds > baseline["phases"][name] * (1 + tolerance):
+            regressions.append(f"{name} took {seconds:.2f} s, baseline {baseline['phases'][name]:.2f} s")
+    for key in ("total_seconds", "median_wait_latency"):
+        if summary[key] is not None and baseline.get(key) is not None and summary[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {summary[key]:.2f}, baseline {baseline[key]:.2f}")
+    key = "strokes_per_second"
+    if summary[key] is not None and baseline.get(key) is not None and summary[key] < baseline[key] * (1 - tolerance):
+        regressions.append(f"{key} {summary[key]:.2f}, baseline {baseline[key]:.2f}")
+    return regressions
+
+
+def save_report(path: str, summary: dict, results: list[dict]):
+    with open(path, "w") as report_file:
+        json.dump({"summary": summary, "runs": results}, report_file, indent=4)
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as baseline_file:
+        return json.load(baseline_file)["summary"]
+
+
+def run_smoke_test(timeout: float = 900) -> bool:
+    """
+    Runs the whole harness once with two squares, in a new process so pyautogui connects to the virtual display.
+    Passes when the run exits cleanly and its report has the drawing, the erasing and the strokes in it.
+
+    Examples:
+        Skipped where Xvfb is not installed:
+            >>> shutil.which("Xvfb") is None or run_smoke_test()
+            True
+    """
+    report_path = os.path.join(tempfile.mkdtemp(prefix="python_painter_smoke_"), "report.json")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, os.path.join(root, "main.py"), "--xvfb-harness", report_path, "--harness-runs", "1", "--min-squares", "2", "--max-squares", "2"],
+        cwd=root, capture_output=True, text=True, timeout=timeout
+    )
+    if completed.returncode != 0:
+        print(completed.stdout[-2000:], completed.stderr[-2000:])
+        return False
+    summary = load_baseline(report_path)
+    return (
+        "Drawing squares" in summary["phases"] and "Erasing squares" in summary["phases"]
+        and bool(summary["strokes_per_second"])
+    )
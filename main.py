@@ -1,15 +1,33 @@
-import pyautogui as pya
-from pyscreeze import Box, Point
-
 import argparse
+import os
 import random
+import subprocess
+import sys
+import tempfile
+from contextlib import nullcontext
+from typing import Optional
 
-from automations.painter import Painter
+from automations.painter import Painter, create_painting_border_for_brush, plan_erasure_lines
 from automations.krita import Krita
 from automations.machine import Machine
 from automations.software_base import SoftwareBase
+from automations.match_calibration import calibrate_screenshots_directory
+from automations.dry_run import ActionCostModel, ActionTimer, DryRun
+from automations.gui import phase
+from automations.input_scheduler import InputScheduler
+from automations.matching import default_match_cache, default_tiled_matcher
+from automations.tracing import Tracer
+from automations.offline import render_scenes, render_square_template
+from automations.standin import StandinMachine, StandinPaint, generate_templates, get_screen_size_for_canvas
+from automations.xvfb_harness import RunRecorder, XvfbDisplay, compare_to_baseline, load_baseline, save_report, summarize_runs
+from automations.drag_calibration import calibrate_drag_speed
+from automations.rectangle_calibration import RectangleToolCorrection, calibrate_rectangle_tool
 from shapes.square import Square, create_squares
-from shapes.common import Size
+from shapes.common import Box, Point, Size, order_strokes_for_short_travel
+
+# Modules that need a display or are slow to import. Importing main must not import any of them
+DEFERRED_MODULES = ("pyautogui", "pyscreeze", "pywinctl", "cv2")
+IMPORT_BUDGET_SECONDS = 1.0
 
 def parse_args():
     desciption = """
@@ -67,57 +85,400 @@ def parse_args():
         default=100,
         help='Height of each square (default: 100)'
     )
+
+    parser.add_argument(
+        '--calibrate-matching',
+        type=str,
+        default=None,
+        metavar='FIXTURES_DIR',
+        help='Calibrate the matching parameters of the screenshots against the fixture frames in FIXTURES_DIR and exit'
+    )
+
+    parser.add_argument(
+        '--calibrate-drag-speed',
+        action='store_true',
+        help='Find the shortest freehand drag duration for each segment length on this machine, save it and exit'
+    )
+
+    parser.add_argument(
+        '--calibrate-rectangle-tool',
+        action='store_true',
+        help='Measure how much the rectangle tool squares differ from the freehand ones with the current brush size, save the correction and exit'
+    )
+
+    parser.add_argument(
+        '--rectangle-tool',
+        action='store_true',
+        help='Draw each square with one drag of the calibrated rectangle tool instead of four freehand drags'
+    )
+
+    parser.add_argument(
+        '--render-scenes',
+        type=str,
+        default=None,
+        metavar='OUTPUT_DIR',
+        help='Render scenes of randomly placed squares with their ground truth and the counting template to OUTPUT_DIR without a display and exit'
+    )
+
+    parser.add_argument(
+        '--scene-count',
+        type=int,
+        default=100,
+        help='Number of scenes rendered by --render-scenes (default: 100)'
+    )
+
+    parser.add_argument(
+        '--scene-format',
+        choices=('png', 'ora'),
+        default='png',
+        help='File format of the scenes rendered by --render-scenes (default: png)'
+    )
+
+    parser.add_argument(
+        '--plan-only',
+        action='store_true',
+        help='Only plan the square placement and erasure lines. Does not need a display'
+    )
+
+    parser.add_argument(
+        '--no-input-scheduler',
+        action='store_true',
+        help='Send every input action right away with the default pyautogui pause'
+    )
+
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Walk through the run without touching the screen. Prints the planned actions and a per phase wall time estimate'
+    )
+
+    parser.add_argument(
+        '--measure-costs',
+        action='store_true',
+        help='Time the actions of a real run and save them as the cost model used by --dry-run'
+    )
+
+    parser.add_argument(
+        '--verify-shapes',
+        action='store_true',
+        help='Check every square right after drawing it from its own area, and redraw it if it is not found. Skips counting the squares from the whole screen'
+    )
+
+    parser.add_argument(
+        '--binary-matching',
+        action='store_true',
+        help='Count and verify the squares by matching 1-bit ink masks first, for the templates whose calibrated match profile found it exact'
+    )
+
+    parser.add_argument(
+        '--trace',
+        type=str,
+        default=None,
+        metavar='FILE',
+        help='Record every screenshot, match, input action and sleep as a Chrome trace to FILE. Open it in Perfetto'
+    )
+
+    parser.add_argument(
+        '--match-workers',
+        type=int,
+        default=None,
+        help='Threads used to match large frames in tiles. 1 matches the tiles one by one, 0 turns the tiling off'
+    )
+
+    parser.add_argument(
+        '--xvfb-harness',
+        type=str,
+        default=None,
+        metavar='REPORT_FILE',
+        help='Experimental: run the whole flow against the stand-in drawing app on a virtual X display and write the timings to REPORT_FILE'
+    )
+
+    parser.add_argument(
+        '--harness-runs',
+        type=int,
+        default=3,
+        help='Number of runs made by --xvfb-harness (default: 3)'
+    )
+
+    parser.add_argument(
+        '--harness-baseline',
+        type=str,
+        default=None,
+        metavar='REPORT_FILE',
+        help='Earlier --xvfb-harness report. Exits with an error if the new timings are more than 25%% worse'
+    )
+
+    parser.add_argument(
+        '--check-import-budget',
+        action='store_true',
+        help=f'Check that importing main stays under {IMPORT_BUDGET_SECONDS} s without importing the GUI stack and exit'
+    )
     args = parser.parse_args()
-    screenshots = args.screenshots_dir
     if args.max_squares < args.min_squares:
         print("Max squares can not be lower than min squares. Setting both to min squares")
-        squrare_min_max = (args.min_squares, args.min_squares)
+        args.squrare_min_max = (args.min_squares, args.min_squares)
     else:
-        squrare_min_max = (args.min_squares, args.max_squares)
+        args.squrare_min_max = (args.min_squares, args.max_squares)
 
-    square_size = Size(args.square_width, args.square_height)
+    args.square_size = Size(args.square_width, args.square_height)
 
-    return screenshots, squrare_min_max, square_size
+    return args
 
-def main(screenshots: str, squrare_min_max: tuple[int], square_size: Size):
+def main(
+        screenshots: str,
+        squrare_min_max: tuple[int],
+        square_size: Size,
+        dry_run: Optional[DryRun] = None,
+        schedule_input: bool = True,
+        software: Optional[SoftwareBase] = None,
+        machine_class: type[Machine] = Machine,
+        verify_shapes: bool = False,
+        binary_matching: bool = False,
+        rectangle_tool: bool = False
+        ):
     print("STARTING".center(70, "-"))
-    machine = Machine(screenshots) # move to args -> windows11, debian12 and ubuntu21.04 do things differently
-    software = Krita(f"{screenshots}/krita") # move to args -> krita, paint and gimp have completely different UI and hotkeys
-    painter = Painter(machine, software)
-    painter.open_used_software()
-    painter.start_new_drawing(Size(2560, 1440)) # TODO - create a way for not hard coding this. Requires support for finding correct draw are
+    input_scheduler = InputScheduler() if schedule_input else None
+    machine = machine_class(screenshots, input_scheduler) # move to args -> windows11, debian12 and ubuntu21.04 do things differently
+    try:
+        if software is None:
+            software = Krita(f"{screenshots}/krita") # move to args -> krita, paint and gimp have completely different UI and hotkeys
+        if dry_run is not None and rectangle_tool:
+            # Planned drags do not need calibration data, the offsets do not change their number or cost
+            software.rectangle_correction = RectangleToolCorrection({software.get_brush_size(): (0, 0, 0, 0), **software.rectangle_correction.offsets})
+        painter = Painter(machine, software)
+        with phase("Opening software"):
+            painter.open_used_software()
+        with phase("New document"):
+            painter.start_new_drawing(Size(2560, 1440)) # TODO - create a way for not hard coding this. Requires support for finding correct draw are
+
+            draw_area = painter.get_painting_borders()
+
+        square_count = random.randint(*squrare_min_max) # Randomise the square count for each run
+
+        squares = create_squares(square_count, draw_area, square_size, painter.get_current_brush_size())
+        print(f"{draw_area=}")
+        print("Squares created")
+
+        preset_img = f"{software.scr_directories['shapes']}/square_freehand_40_100_100_black_on_white.png"
+        with phase("Drawing squares"):
+            if verify_shapes:
+                painter.draw_shapes_on_canvas(squares, preset_img, rectangle_tool=rectangle_tool, confidence=0.98, binary=binary_matching)
+            else:
+                painter.draw_shapes_on_canvas(squares, rectangle_tool=rectangle_tool)
+        print("Squares drawn")
+        if dry_run is not None:
+            dry_run.track_shapes(squares, painter.get_current_brush_size(), confidence=0.98)
 
-    draw_area = painter.get_painting_borders()
+        if verify_shapes:
+            # Every square was found in its own area right after drawing it
+            preset_found = square_count
+            print(f"Verified {square_count}/{square_count} squares drawn, with presaved screenshot")
+        else:
+            with phase("Counting squares"):
+                # Using one of the drawn shapes as benchmark, this time the first one drawn
+                shape_scr = machine.get_shape_screenshot(squares[0])
+                if binary_matching:
+                    # Calibrated profiles pick the matcher of each image
+                    preset_found = machine.count_all_image_occurances(preset_img, confidence=0.98, binary=True)
+                    found_scr = machine.count_all_image_occurances(shape_scr, confidence=0.99, binary=True)
+                else:
+                    # Both templates share one capture and one transform of the screen
+                    preset_found, found_scr = machine.count_all_images_occurances([preset_img, shape_scr], confidence=[0.98, 0.99])
+                print(f"Found {preset_found}/{square_count} squares drawn, with presaved screenshot")
+                print(f"Found {found_scr}/{square_count} squares drawn, with new screenshot")
 
-    square_count = random.randint(*squrare_min_max) # Randomise the square count for each run
+        with phase("Erasing squares"):
+            painter.draw_random_lines_on_canvas_until_image_not_found(
+                draw_area, preset_img, shapes = squares, images_found = preset_found if verify_shapes else None,
+                confidence = 0.98, binary = binary_matching
+            )
 
-    squares = create_squares(square_count, draw_area, square_size, painter.get_current_brush_size())
+
+        with phase("Closing software"):
+            painter.close_used_software()
+    finally:
+        # Queued input is sent and the scheduler removed even when the run fails
+        if input_scheduler is not None:
+            print(f"Input scheduler sent {input_scheduler.sent_actions} actions and dropped {input_scheduler.dropped_actions} redundant ones")
+            machine.stop_input_scheduler()
+    if software.layout is not None and (software.layout.hits or software.layout.misses):
+        print(f"UI layout cache found {software.layout.hits} elements at their remembered position, {software.layout.misses} had moved")
+    if default_match_cache.enabled:
+        print(f"Match cache answered {default_match_cache.hits}/{default_match_cache.hits + default_match_cache.misses} screen searches")
+
+
+def plan(squrare_min_max: tuple[int], square_size: Size, canvas_size: Size = Size(2560, 1440), brush_size: int = 40, confidence: float = 0.98):
+    """Runs the placement and erasure planning of main() without a display"""
+    print("PLANNING".center(70, "-"))
+    draw_area = create_painting_border_for_brush(Box(0, 0, canvas_size.width, canvas_size.height), brush_size)
+    square_count = random.randint(*squrare_min_max)
+    squares = create_squares(square_count, draw_area, square_size, brush_size)
     print(f"{draw_area=}")
-    print("Squares created")
 
-    painter.draw_shapes_on_canvas(squares)
-    print("Squares drawn")
+    strokes = order_strokes_for_short_travel([square.get_points_for_continuous_drawing() for square in squares])
+    print(f"Drawing {square_count} squares:")
+    for stroke in strokes:
+        print(f"\t{stroke}")
+
+    lines = plan_erasure_lines(draw_area, squares, brush_size, confidence)
+    print(f"Erasure predicted to take {len(lines)} lines before the first screen check")
+
+
+def render_offline_scenes(output_directory: str, scene_count: int, squrare_min_max: tuple[int], square_size: Size, brush_size: int, file_format: str = "png"):
+    """Renders scenes for benchmarking the counting offline, with the template they are counted with"""
+    print("RENDERING SCENES".center(70, "-"))
+    paths = render_scenes(output_directory, scene_count, square_size=square_size, square_min_max=squrare_min_max, brush_size=brush_size, file_format=file_format)
+    template_path = os.path.join(output_directory, "template.png")
+    render_square_template(square_size, brush_size).save(template_path)
+    print(f"Rendered {len(paths)} scenes to {output_directory}, counting template {template_path}")
+
+
+def check_import_budget(budget_seconds: float = IMPORT_BUDGET_SECONDS) -> bool:
+    """Imports main in a fresh interpreter and checks the time and that the GUI stack stays unimported"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+    elapsed, imported = float(output[0]), output[1]
+
+    print(f"Importing main took {elapsed:.3f} s (budget {budget_seconds} s)")
+    if imported:
+        print(f"Imported modules that should be deferred: {imported}")
+    return elapsed <= budget_seconds and not imported
+
+
+def calibrate_matching(screenshots: str, fixtures_directory: str):
+    print("CALIBRATING MATCHING".center(70, "-"))
+    profiles = calibrate_screenshots_directory(screenshots, fixtures_directory)
+    for template, profile in profiles.items():
+        if profile is None:
+            print(f"{template}: no settings gave exact counts, profile not written")
+        else:
+            print(f"{template}: {profile}")
 
 
-    # Using the screenshot
-    preset_img = f"{software.scr_directories['shapes']}/square_freehand_40_100_100_black_on_white.png"
-    preset_found = machine.count_all_image_occurances(preset_img, confidence=0.98)
-    print(f"Found {preset_found}/{square_count} squares drawn, with presaved screenshot")
+def calibrate_freehand_drag_speed(screenshots: str):
+    print("CALIBRATING DRAG SPEED".center(70, "-"))
+    machine = Machine(screenshots)
+    software = Krita(f"{screenshots}/krita")
+    painter = Painter(machine, software)
+    painter.open_used_software()
+    painter.start_new_drawing(Size(2560, 1440))
+
+    curve = calibrate_drag_speed(software, painter.get_painting_borders())
+    curve.save(software.software_name)
+    print(f"Saved drag speed curve: {curve.get_points()}")
+
+    painter.close_used_software()
 
-    # Using one of the drawn shapes as benchmark, this time the first one drawn
-    shape_scr = squares[0].get_screenshot()
-    found_scr = machine.count_all_image_occurances(shape_scr, confidence=0.99)
-    print(f"Found {found_scr}/{square_count} squares drawn, with new screenshot")
 
-    painter.draw_random_lines_on_canvas_until_image_not_found(draw_area, preset_img, confidence = 0.98)
+def calibrate_rectangle_tool_correction(screenshots: str):
+    print("CALIBRATING RECTANGLE TOOL".center(70, "-"))
+    machine = Machine(screenshots)
+    software = Krita(f"{screenshots}/krita")
+    painter = Painter(machine, software)
+    painter.open_used_software()
+    painter.start_new_drawing(Size(2560, 1440))
 
+    correction = calibrate_rectangle_tool(software, painter.get_painting_borders(), correction=software.rectangle_correction)
+    correction.save(software.software_name)
+    print(f"Saved rectangle tool correction: {correction.offsets}")
 
     painter.close_used_software()
 
 
+def run_xvfb_harness(squrare_min_max: tuple[int], square_size: Size, runs: int, report_path: str, baseline_path: Optional[str] = None, schedule_input: bool = True, verify_shapes: bool = False, binary_matching: bool = False) -> bool:
+    """
+    Runs main() against the stand-in drawing app on a virtual X display with real input and capture.
+    Writes the phase timings, wait latencies and stroke throughput of the runs to report_path.
+    Experimental: only checked by xvfb_harness.run_smoke_test, which is skipped where Xvfb is not installed.
+
+    Returns:
+        bool: False if the timings regressed from the baseline report
+    """
+    print("XVFB HARNESS (EXPERIMENTAL)".center(70, "-"))
+    canvas_size = Size(2560, 1440)
+    screen_size = get_screen_size_for_canvas(canvas_size)
+    screenshots = tempfile.mkdtemp(prefix="python_painter_standin_")
+    standin_directory = generate_templates(screenshots, canvas_size)
+
+    results = []
+    with XvfbDisplay(screen_size) as display:
+        print(f"Virtual display {display.display} ({screen_size.width}x{screen_size.height})")
+        for run in range(runs):
+            print(f"Run {run + 1}/{runs}")
+            with RunRecorder() as recorder:
+                main(
+                    screenshots, squrare_min_max, square_size, schedule_input=schedule_input,
+                    software=StandinPaint(standin_directory, screen_size), machine_class=StandinMachine,
+                    verify_shapes=verify_shapes, binary_matching=binary_matching
+                )
+            results.append(recorder.get_result())
+
+    summary = summarize_runs(results)
+    save_report(report_path, summary, results)
+    print(f"Harness report written to {report_path}: {summary}")
+    if baseline_path is None:
+        return True
+
+    regressions = compare_to_baseline(summary, load_baseline(baseline_path))
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return not regressions
 
-    
 
 if __name__=="__main__":
     args = parse_args()
-    main(*args)
+    if args.rectangle_tool and not (args.dry_run or args.plan_only or args.calibrate_rectangle_tool):
+        # Fails before opening the software instead of after the document is set up
+        krita = Krita(f"{args.screenshots_dir}/krita")
+        if krita.get_brush_size() not in krita.rectangle_correction.offsets:
+            sys.exit(f"{krita.software_name} rectangle tool is not calibrated for brush size {krita.get_brush_size()}, run --calibrate-rectangle-tool first")
+    if args.match_workers is not None:
+        default_tiled_matcher.workers = max(1, args.match_workers)
+        default_tiled_matcher.enabled = args.match_workers > 0
+    tracer = Tracer() if args.trace else None
+    try:
+        with tracer or nullcontext():
+            if args.check_import_budget:
+                sys.exit(0 if check_import_budget() else 1)
+            elif args.calibrate_matching:
+                calibrate_matching(args.screenshots_dir, args.calibrate_matching)
+            elif args.calibrate_drag_speed:
+                calibrate_freehand_drag_speed(args.screenshots_dir)
+            elif args.calibrate_rectangle_tool:
+                calibrate_rectangle_tool_correction(args.screenshots_dir)
+            elif args.xvfb_harness:
+                passed = run_xvfb_harness(
+                    args.squrare_min_max, args.square_size, args.harness_runs, args.xvfb_harness,
+                    args.harness_baseline, not args.no_input_scheduler, args.verify_shapes, args.binary_matching
+                )
+                sys.exit(0 if passed else 1)
+            elif args.dry_run:
+                with DryRun() as dry_run:
+                    main(args.screenshots_dir, args.squrare_min_max, args.square_size, dry_run, not args.no_input_scheduler, verify_shapes=args.verify_shapes, binary_matching=args.binary_matching, rectangle_tool=args.rectangle_tool)
+                dry_run.print_report()
+            elif args.measure_costs:
+                with ActionTimer() as timer:
+                    main(args.screenshots_dir, args.squrare_min_max, args.square_size, schedule_input=not args.no_input_scheduler, verify_shapes=args.verify_shapes, binary_matching=args.binary_matching, rectangle_tool=args.rectangle_tool)
+                cost_model = ActionCostModel.load()
+                timer.calibrate(cost_model)
+                cost_model.save()
+                print(f"Saved action costs: {cost_model.overheads}")
+            elif args.render_scenes:
+                render_offline_scenes(
+                    args.render_scenes, args.scene_count, args.squrare_min_max, args.square_size,
+                    Krita(f"{args.screenshots_dir}/krita").get_brush_size(), args.scene_format
+                )
+            elif args.plan_only:
+                plan(args.squrare_min_max, args.square_size, brush_size=Krita(f"{args.screenshots_dir}/krita").get_brush_size())
+            else:
+                main(args.screenshots_dir, args.squrare_min_max, args.square_size, schedule_input=not args.no_input_scheduler, verify_shapes=args.verify_shapes, binary_matching=args.binary_matching, rectangle_tool=args.rectangle_tool)
+    finally:
+        # A failed or stalled run is what the trace is most needed for
+        if tracer is not None:
+            tracer.save(args.trace)
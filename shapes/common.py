@@ -1,9 +1,11 @@
 from collections import namedtuple
-from pyscreeze import Point, Box
 
 import random
 from typing import Union, Optional
 
+# Same fields as the pyscreeze Point and Box, so the shapes can be used without importing the capture stack
+Point = namedtuple("Point", ["x", "y"])
+Box = namedtuple("Box", ["left", "top", "width", "height"])
 Size = namedtuple("Size", ["width", "height"])
 
 def create_random_point_within_boundaries(
@@ -19,4 +21,68 @@ def create_random_point_within_boundaries(
     """
     x = random.randint(boundaries.left + modifier_left, boundaries.left + boundaries.width + modifier_right)
     y = random.randint(boundaries.top + modifier_top, boundaries.top + boundaries.height + modifier_bottom)
-    return Point(x, y)
\ No newline at end of file
+    return Point(x, y)
+
+def distance_between_points(start: Point, end: Point) -> float:
+    """Returns the euclidean distance between two points
+
+    Examples:
+        >>> distance_between_points(Point(0, 0), Point(3, 4))
+        5.0
+    """
+    return ((end.x - start.x) ** 2 + (end.y - start.y) ** 2) ** 0.5
+
+
+def order_strokes_for_short_travel(strokes: list[list[Point]], start: Optional[Point] = None) -> list[list[Point]]:
+    """Orders the strokes so that the pen-up travel between them stays short
+
+    Uses greedy nearest-neighbour ordering. Open strokes can be drawn in reverse and
+    closed strokes (first point == last point) can be started from any of their corners,
+    so the closest entry point of every remaining stroke is considered.
+
+    Args:
+        strokes (list[list[Point]]): Strokes as lists of points to draw continuously
+        start (Point, optional): Where the pen currently is. Defaults to the start of the first stroke
+
+    Returns:
+        list[list[Point]]: The same strokes, reordered and possibly reversed or rotated
+
+    Examples:
+        Open strokes get reversed if their end is closer:
+            >>> strokes = [[Point(0, 0), Point(10, 0)], [Point(100, 0), Point(20, 0)], [Point(11, 0), Point(15, 0)]]
+            >>> order_strokes_for_short_travel(strokes)
+            [[Point(x=0, y=0), Point(x=10, y=0)], [Point(x=11, y=0), Point(x=15, y=0)], [Point(x=20, y=0), Point(x=100, y=0)]]
+
+        Closed strokes start from the closest corner:
+            >>> square = [Point(0, 0), Point(10, 0), Point(10, 10), Point(0, 10), Point(0, 0)]
+            >>> order_strokes_for_short_travel([square], start=Point(12, 12))
+            [[Point(x=10, y=10), Point(x=0, y=10), Point(x=0, y=0), Point(x=10, y=0), Point(x=10, y=10)]]
+    """
+    remaining = [list(stroke) for stroke in strokes if stroke]
+    if not remaining:
+        return []
+
+    position = start if start is not None else remaining[0][0]
+    ordered = []
+    while remaining:
+        best_index, best_stroke, best_distance = 0, remaining[0], None
+        for index, stroke in enumerate(remaining):
+            for candidate in _stroke_entry_variants(stroke):
+                distance = distance_between_points(position, candidate[0])
+                if best_distance is None or distance < best_distance:
+                    best_index, best_stroke, best_distance = index, candidate, distance
+
+        remaining.pop(best_index)
+        ordered.append(best_stroke)
+        position = best_stroke[-1]
+
+    return ordered
+
+
+def _stroke_entry_variants(stroke: list[Point]) -> list[list[Point]]:
+    """All the ways the stroke can be drawn while producing the same line"""
+    if len(stroke) > 2 and stroke[0] == stroke[-1]:
+        # Closed stroke, can be started from any corner
+        corners = stroke[:-1]
+        return [corners[i:] + corners[:i] + [corners[i]] for i in range(len(corners))]
+    return [stroke, stroke[::-1]]
@@ -0,0 +1,135 @@
+import numpy as np
+
+from shapes.common import Point
+from shapes.shape import Shape
+
+#
+#   CLASSES
+#
+class StrokeCoverageEstimator:
+    """Estimates how much of each shape the erasure strokes have covered, without reading the screen.
+
+    Every shape's area (the brush inflated bounding box given by the get_*_edge methods) is sampled
+    on a grid. Samples under the shape's own outline are ink already, the rest are paper. An erasure
+    stroke changes the paper samples within its brush radius. The changed fraction of the area is
+    turned into a predicted match score, and the shape is predicted broken when the score falls below
+    the matching confidence.
+
+    The model is calibrated with real checks, shape by shape. When a check still finds shapes on the
+    screen, the least covered shapes are taken to be the ones found, and those predicted broken get half
+    their score drop per covered fraction. The drop never goes under the one that predicts the shape
+    broken at min_broken_coverage of its paper, so every shape can still be predicted broken later.
+
+    Args:
+        shapes (list[Shape]): Shapes drawn on the canvas.
+        confidence (float): Confidence used when matching the shapes.
+        sample_step (int): Distance between the samples in pixels.
+        score_drop_per_coverage (float): How much the match score drops when the whole area is changed, before calibration.
+        min_broken_coverage (float): Share of its paper that breaks a shape however far it is calibrated.
+
+    Examples:
+        A stroke through the middle of a square breaks it, one far away does not:
+            >>> from shapes.square import Square
+            >>> from shapes.common import Size
+            >>> squares = [Square(Point(0, 0), Size(100, 100), 10), Square(Point(500, 0), Size(100, 100), 10)]
+            >>> estimator = StrokeCoverageEstimator(squares, confidence=0.98)
+            >>> estimator.add_stroke([Point(0, 50), Point(100, 50)], brush_size=10)
+            >>> estimator.is_predicted_broken(0), estimator.is_predicted_broken(1), estimator.all_predicted_broken()
+            (True, False, False)
+
+        A check finds one of them, the less covered one is calibrated:
+            >>> estimator.add_stroke([Point(500, 50), Point(600, 50)], brush_size=10)
+            >>> estimator.add_stroke([Point(0, 20), Point(100, 20)], brush_size=10)
+            >>> estimator.calibrate(1)
+            >>> estimator.get_score_drops()
+            [0.5, 0.25]
+    """
+    def __init__(self, shapes: list[Shape], confidence: float = 0.98, sample_step: int = 4, score_drop_per_coverage: float = 0.5, min_broken_coverage: float = 0.9):
+        self.shapes = shapes
+        self.confidence = confidence
+        self.sample_step = sample_step
+        self.min_broken_coverage = min_broken_coverage
+        self._score_drops = [score_drop_per_coverage] * len(shapes)
+
+        self._samples = []
+        self._paper = []
+        self._changed = []
+        for shape in shapes:
+            xs, ys = np.meshgrid(
+                np.arange(shape.get_left_edge(), shape.get_right_edge() + 1, sample_step, dtype=np.float64),
+                np.arange(shape.get_top_edge(), shape.get_bottom_edge() + 1, sample_step, dtype=np.float64)
+            )
+            xs, ys = xs.ravel(), ys.ravel()
+            outline = shape.get_points_for_continuous_drawing()
+            ink = _within_distance_of_polyline(xs, ys, outline, shape.brush_width)
+            self._samples.append((xs, ys))
+            self._paper.append(~ink)
+            self._changed.append(np.zeros(xs.shape, dtype=bool))
+
+    def add_stroke(self, points: list[Point], brush_size: int):
+        """Registers an erasure stroke drawn through the points with the given brush size"""
+        radius = brush_size / 2
+        left = min(point[0] for point in points) - radius
+        right = max(point[0] for point in points) + radius
+        top = min(point[1] for point in points) - radius
+        bottom = max(point[1] for point in points) + radius
+
+        for index, shape in enumerate(self.shapes):
+            # Cheap bounding box rejection before the per sample distances
+            if left > shape.get_right_edge() or right < shape.get_left_edge():
+                continue
+            if top > shape.get_bottom_edge() or bottom < shape.get_top_edge():
+                continue
+            xs, ys = self._samples[index]
+            covered = self._paper[index] & _within_distance_of_polyline(xs, ys, points, radius) & ~self._changed[index]
+            self._changed[index] |= covered
+
+    def get_coverage(self, index: int) -> float:
+        """Fraction of the shape's area the erasure strokes have changed"""
+        return float(self._changed[index].sum() / self._changed[index].size)
+
+    def get_paper_fraction(self, index: int) -> float:
+        """Fraction of the shape's area that is paper, the most the strokes can cover"""
+        return float(self._paper[index].sum() / self._paper[index].size)
+
+    def get_score_drops(self) -> list[float]:
+        return list(self._score_drops)
+
+    def get_predicted_score(self, index: int) -> float:
+        return 1.0 - self.get_coverage(index) * self._score_drops[index]
+
+    def is_predicted_broken(self, index: int) -> bool:
+        return bool(self.get_predicted_score(index) < self.confidence)
+
+    def all_predicted_broken(self) -> bool:
+        return all(self.is_predicted_broken(index) for index in range(len(self.shapes)))
+
+    def calibrate(self, images_found: int):
+        """Corrects the model with a real check that found images_found of the shapes still intact"""
+        least_covered = sorted(range(len(self.shapes)), key=self.get_predicted_score, reverse=True)[:images_found]
+        for index in least_covered:
+            if not self.is_predicted_broken(index):
+                continue
+            paper = self.get_paper_fraction(index)
+            min_drop = (1 - self.confidence) / (self.min_broken_coverage * paper) if paper else self._score_drops[index]
+            self._score_drops[index] = max(self._score_drops[index] / 2, min_drop)
+
+
+def _within_distance_of_polyline(xs: np.ndarray, ys: np.ndarray, points: list[Point], distance: float) -> np.ndarray:
+    """Which of the samples are at most distance away from the polyline through the points"""
+    within = np.zeros(xs.shape, dtype=bool)
+    if len(points) == 1:
+        points = [points[0], points[0]]
+    for start, end in zip(points, points[1:]):
+        within |= _distance_to_segment(xs, ys, start, end) <= distance
+    return within
+
+
+def _distance_to_segment(xs: np.ndarray, ys: np.ndarray, start: Point, end: Point) -> np.ndarray:
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0:
+        return np.hypot(xs - start[0], ys - start[1])
+    t = np.clip(((xs - start[0]) * dx + (ys - start[1]) * dy) / length_squared, 0.0, 1.0)
+    return np.hypot(xs - (start[0] + t * dx), ys - (start[1] + t * dy))
@@ -1,8 +1,6 @@
-from pyscreeze import Point
-
 from typing import Union, Optional
 
-from shapes.common import Size
+from shapes.common import Box, Point, Size
 
 
 class Shape:
@@ -32,8 +30,17 @@ class Shape:
     def get_bottom_edge(self) -> int:
         raise NotImplementedError
     
+    def get_bounding_box(self) -> Box:
+        """Area the drawn shape covers, brush width included"""
+        left, top = self.get_left_edge(), self.get_top_edge()
+        return Box(left, top, self.get_right_edge() - left, self.get_bottom_edge() - top)
+
     def is_colliding_with(self, square: "Shape") -> bool:
         raise NotImplementedError     
 
-    def get_screenshot(self):
+    def get_screenshot_region(self) -> tuple[int, int, int, int]:
+        raise NotImplementedError
+
+    def get_screenshot(self, store=None):
+        """Returns a SnapshotHandle to the shape's area in the snapshot store"""
         raise NotImplementedError
@@ -0,0 +1,161 @@
+import numpy as np
+from PIL import Image as PILImage
+from PIL.Image import Image
+
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Union
+
+#
+#   CLASSES
+#
+class SnapshotEvicted(LookupError):
+    """Exception raised when the snapshot of a handle has been evicted from the store.
+
+    Args:
+        key (str): Content hash of the evicted snapshot.
+
+    Examples:
+        >>> raise SnapshotEvicted("abc")
+        Traceback (most recent call last):
+            ...
+        snapshot_store.SnapshotEvicted: Snapshot abc has been evicted from the store
+    """
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__(f"Snapshot {key} has been evicted from the store")
+
+
+class SnapshotHandle:
+    """Reference to a snapshot kept in a SnapshotStore.
+
+    Handles are cheap to keep around. The pixels live in the store, and identical
+    snapshots share the same pixels.
+
+    Attributes:
+        key (str): Content hash of the snapshot, identical snapshots have identical keys.
+        shape (tuple[int, int, int]): Height, width and channels of the snapshot.
+        store (SnapshotStore): Store where the pixels are kept.
+    """
+    def __init__(self, key: str, shape: tuple[int, int, int], store: "SnapshotStore"):
+        self.key = key
+        self.shape = shape
+        self.store = store
+
+    def __repr__(self) -> str:
+        return f"SnapshotHandle(key={self.key!r}, shape={self.shape})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SnapshotHandle) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """Width and height, like PIL.Image.size"""
+        return (self.shape[1], self.shape[0])
+
+    @property
+    def array(self) -> np.ndarray:
+        """Read-only uint8 RGB pixels of the snapshot
+
+        Raises:
+            SnapshotEvicted: If the store has evicted the snapshot
+        """
+        return self.store.get(self.key)
+
+    def to_image(self) -> Image:
+        return PILImage.fromarray(self.array, "RGB")
+
+
+class SnapshotStore:
+    """Deduplicated, memory-bounded store for snapshots.
+
+    Snapshots are kept as compact uint8 RGB arrays keyed by a hash of their content.
+    Adding a pixel-identical snapshot again returns a handle to the existing pixels.
+    When the stored bytes exceed the byte budget, the least recently used snapshots are evicted.
+
+    Args:
+        byte_budget (int): Maximum number of pixel bytes kept. Defaults to 64 MiB.
+
+    Examples:
+        Identical snapshots are stored once:
+            >>> store = SnapshotStore(byte_budget=1000)
+            >>> first = store.add(np.zeros((10, 10, 3), dtype=np.uint8))
+            >>> second = store.add(np.zeros((10, 10, 3), dtype=np.uint8))
+            >>> first == second, len(store), store.stored_bytes
+            (True, 1, 300)
+
+        Least recently used snapshots are evicted when the budget runs out:
+            >>> third = store.add(np.ones((10, 10, 3), dtype=np.uint8))
+            >>> fourth = store.add(np.full((10, 10, 3), 2, dtype=np.uint8))
+            >>> fifth = store.add(np.full((10, 10, 3), 3, dtype=np.uint8))
+            >>> first in store, fifth in store, store.stored_bytes
+            (False, True, 900)
+    """
+    def __init__(self, byte_budget: int = 64 * 1024 * 1024):
+        self.byte_budget = byte_budget
+        self.stored_bytes = 0
+        self._snapshots: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def __contains__(self, handle: Union[SnapshotHandle, str]) -> bool:
+        key = handle.key if isinstance(handle, SnapshotHandle) else handle
+        return key in self._snapshots
+
+    def add(self, snapshot: Union[Image, np.ndarray]) -> SnapshotHandle:
+        """Stores the snapshot, or shares the already stored identical one, and returns its handle"""
+        pixels = _to_rgb_array(snapshot)
+        key = _content_hash(pixels)
+
+        if key in self._snapshots:
+            self._snapshots.move_to_end(key)
+        else:
+            pixels.setflags(write=False)
+            self._snapshots[key] = pixels
+            self.stored_bytes += pixels.nbytes
+            self._evict(keep=key)
+
+        return SnapshotHandle(key, pixels.shape, self)
+
+    def get(self, key: str) -> np.ndarray:
+        try:
+            pixels = self._snapshots[key]
+        except KeyError:
+            raise SnapshotEvicted(key) from None
+        self._snapshots.move_to_end(key)
+        return pixels
+
+    def clear(self):
+        self._snapshots.clear()
+        self.stored_bytes = 0
+
+    def _evict(self, keep: Optional[str] = None):
+        # The newest snapshot is always kept, even if it alone is over the budget
+        while self.stored_bytes > self.byte_budget and len(self._snapshots) > 1:
+            key, pixels = next(iter(self._snapshots.items()))
+            if key == keep:
+                break
+            del self._snapshots[key]
+            self.stored_bytes -= pixels.nbytes
+
+
+def _to_rgb_array(snapshot: Union[Image, np.ndarray]) -> np.ndarray:
+    if isinstance(snapshot, np.ndarray):
+        # Copied, the stored pixels are made read-only and must not share memory with the caller
+        return np.array(snapshot, dtype=np.uint8, order="C")
+    return np.ascontiguousarray(np.asarray(snapshot.convert("RGB")), dtype=np.uint8)
+
+
+def _content_hash(pixels: np.ndarray) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(pixels.shape).encode())
+    digest.update(pixels.data)
+    return digest.hexdigest()
+
+
+# Store used by the shapes unless another one is given
+default_snapshot_store = SnapshotStore()
@@ -1,11 +1,10 @@
-import pyautogui as pya
-from pyscreeze import Point, Box
 from PIL.Image import Image
 
 from typing import Union, Optional
 
-from shapes.common import Size, create_random_point_within_boundaries
+from shapes.common import Point, Box, Size, create_random_point_within_boundaries
 from shapes.shape import Shape
+from shapes.snapshot_store import SnapshotHandle, SnapshotStore, default_snapshot_store
 
 #
 #   CLASSES
@@ -74,7 +73,7 @@ class Square(Shape):
         get_top_edge() -> int: Returns the y-coordinate of the square's top edge.
         get_bottom_edge() -> int: Returns the y-coordinate of the square's bottom edge.
         is_colliding_with(square: Square) -> bool: Checks if this square overlaps with another square.
-        get_screenshot() -> Image: Takes a screenshot of the square's area.
+        get_screenshot() -> SnapshotHandle: Takes a screenshot of the square's area into the snapshot store.
         __str__() -> str: Returns a string representation of the square.
 
     Examples:
@@ -476,31 +475,48 @@ class Square(Shape):
         
         return True
     
-    def get_screenshot(self):
-        """Capture a screenshot of the square's area.
+    def get_screenshot(self, store: Optional[SnapshotStore] = None) -> SnapshotHandle:
+        """Capture a screenshot of the square's area into the snapshot store.
 
         This method uses the position and size of the square to take a screenshot 
-        of the area it occupies on the screen. The screenshot is captured as an image object.
+        of the area it occupies on the screen. The pixels are kept in a deduplicated,
+        memory-bounded snapshot store and a handle to them is returned, so keeping
+        snapshots of many shapes does not keep many full images in memory.
         Usefull for more accurate counting of the shapes on the screen.
 
+        Args:
+            store (SnapshotStore, optional): Store for the pixels. Defaults to the shared default store.
+
         Returns:
-            Image: An image of the square's current area.
+            SnapshotHandle: Handle to the snapshot of the square's current area.
 
         Examples:
             Take a screenshot of the square:
                 >>> test_square = Square(Point(0, 0), Size(100, 100), 40)
-                >>> image = test_square.get_screenshot()
-                >>> print(type(image) is Image)
+                >>> handle = test_square.get_screenshot()
+                >>> print(type(handle) is SnapshotHandle)
                 True
 
             Take a screenshot of a square at a different position:
                 >>> test_square = Square(Point(50, 50), Size(200, 200), 40)
-                >>> image = test_square.get_screenshot()
-                >>> print(image.size)  # Ensure the size matches the square dimensions
+                >>> handle = test_square.get_screenshot()
+                >>> print(handle.size)  # Ensure the size matches the square dimensions
                 (200, 200)
         """
-        shape_box = (self.get_left_edge(), self.get_top_edge(), self.size.width, self.size.height)
-        return pya.screenshot(region=shape_box)
+        import pyautogui as pya # Imported on first use, needs a display
+
+        if store is None:
+            store = default_snapshot_store
+        return store.add(pya.screenshot(region=self.get_screenshot_region()))
+
+    def get_screenshot_region(self) -> tuple[int, int, int, int]:
+        """Return the screen region captured by get_screenshot as (left, top, width, height).
+
+        Examples:
+            >>> Square(Point(100, 100), Size(100, 100), 40).get_screenshot_region()
+            (80, 80, 100, 100)
+        """
+        return (self.get_left_edge(), self.get_top_edge(), self.size.width, self.size.height)
         
 
 #